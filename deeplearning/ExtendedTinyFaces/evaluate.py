@@ -2,13 +2,13 @@
 import tensorflow as tf
 import tiny_faces_model as tiny_model 
 import util
+import tiles
 from argparse import ArgumentParser
 import cv2
 import scipy.io
 import numpy as np
 import matplotlib.pyplot as plt
 import cv2
-import pickle
 
 import pylab as pl
 import time
@@ -16,12 +16,364 @@ import os
 import sys
 from scipy.special import expit
 import glob
+from mtcnn.nms import nms
 
 MAX_INPUT_DIM = 5000.0   
-    
+# the inputs which height and width round up to the same multiple of BUCKET_SIZE are run together.
+# The padding slightly changes the scores near the bottom and right borders of the smaller inputs,
+# with BUCKET_SIZE = 1 only the inputs of the same shape are batched and the scores are unchanged.
+BUCKET_SIZE = 64
+BATCH_SIZE = 8
+# bound of the memory taken by the activations of the model, in bytes: the inputs run at once are
+# limited to MAX_INFERENCE_MEMORY / BYTES_PER_PIXEL pixels, and the larger inputs are split into tiles
+MAX_INFERENCE_MEMORY = 2 * 1024 ** 3
+# memory of the activations per pixel of input (about 200 bytes measured on CPU)
+BYTES_PER_PIXEL = 256
+
+
+class TinyFaceDetector():
+  def __init__(self, weight_file_path, prob_thresh=0.5, nms_thresh=0.1, nms_backend='numpy'):
+    """
+    Tiny faces detector holding its own graph and session, so that the weights are loaded and
+    the model is built only once for all the pictures to process.
+    :param weight_file_path: A pretrained weight file in the pickle format
+          generated by matconvnet_hr101_to_tf.py.
+    :param prob_thresh: The threshold of detection confidence.
+    :param nms_thresh: The overlap threshold of non maximum suppression
+    :param nms_backend: Non maximum suppression implementation of mtcnn.nms ('numpy', 'grid' or 'numba').
+    """
+    self.prob_thresh = prob_thresh
+    self.nms_thresh = nms_thresh
+    self.nms_backend = nms_backend
+
+    self.graph = tf.Graph()
+    with self.graph.as_default():
+      # placeholder of input images, run in batches of inputs of the same shape
+      self.x = tf.placeholder(tf.float32, [None, None, None, 3]) # n, h, w, c
+
+      # Create the tiny face model which weights are loaded from a pretrained model.
+      self.model = tiny_model.Model(weight_file_path)
+      self.res3b3, self.res4b = self.model.tiny_face_trunk(self.x)
+
+      # sizes of the trunk features at another scale, to which the fed features are resampled
+      self.res3_size = tf.placeholder(tf.int32, [2])
+      self.res4_size = tf.placeholder(tf.int32, [2])
+
+      # we don't run every template on every scale: the score layers computing only the channels
+      # of the templates run on downscaled (False) and upscaled (True) inputs share the trunk
+      Nt = self.model.get_data_by_key("clusters").shape[0]
+      self.tids, self.score_tids, self.score_resampled = {}, {}, {}
+      for upscaled in (False, True):
+        tids = np.array(list(range(4, 12)) + (list(range(18, 25)) if upscaled else []))
+        # classification then the tx, ty, tw and th refinements of each template
+        channels = np.hstack([tids + k * Nt for k in range(5)])
+        scope = "score_2x" if upscaled else "score_1x"
+        with tf.variable_scope(scope):
+          self.score_tids[upscaled] = self.model.tiny_face_score(self.res3b3, self.res4b, channels)
+        # the same score layers on resampled features, used to approximate the scores at other scales
+        resize = tf.image.resize_bilinear if upscaled else tf.image.resize_area
+        with tf.variable_scope(scope, reuse=True):
+          self.score_resampled[upscaled] = self.model.tiny_face_score(resize(self.res3b3, self.res3_size),
+                                                                       resize(self.res4b, self.res4_size), channels)
+        self.tids[upscaled] = tids
+
+      self.sess = tf.Session(graph=self.graph)
+      self.sess.run(tf.global_variables_initializer())
+
+    # Average RGB values from model
+    self.average_image = self.model.get_data_by_key("average_image")
+
+    # Reference boxes of template for 05x, 1x, and 2x scale
+    self.clusters = self.model.get_data_by_key("clusters")
+    self.clusters_h = self.clusters[:, 3] - self.clusters[:, 1] + 1
+    self.clusters_w = self.clusters[:, 2] - self.clusters[:, 0] + 1
+    self.normal_idx = np.where(self.clusters[:, 4] == 1)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  def close(self):
+    """Release the session of the detector."""
+    self.sess.close()
+
+  def _calc_scales(self, raw_img):
+    """
+    Compute the different scales for detection
+    :param raw_img: RGB image
+    :return: [2^X] with X depending on the input image
+    """
+    raw_h, raw_w = raw_img.shape[0], raw_img.shape[1]
+    min_scale = min(np.floor(np.log2(np.max(self.clusters_w[self.normal_idx] / raw_w))),
+                    np.floor(np.log2(np.max(self.clusters_h[self.normal_idx] / raw_h))))
+    max_scale = min(1.0, -np.log2(max(raw_h, raw_w) / MAX_INPUT_DIM))
+    scales_down = pl.frange(min_scale, 0, 1.)
+    scales_up = pl.frange(0.5, max_scale, 0.5)
+    scales_pow = np.hstack((scales_down, scales_up))
+    scales = np.power(2.0, scales_pow)
+    return scales
+
+  def _calc_bounding_boxes(self, score_tids_tf, s, prob_thresh, offset=(0, 0)):
+    """
+    Interpret the heatmap of one scale into bounding boxes.
+    :param score_tids_tf: output of the score layers of the templates of the scale for one image,
+          (h, w, 5 * number of templates)
+    :param s: scale at which the image was processed
+    :param prob_thresh: The threshold of detection confidence.
+    :param offset: position of the heatmap in the one of the whole image, for a tile
+    :return: bounding boxes [x1, y1, x2, y2, score] in the coordinates of the raw image
+    """
+    clusters = self.clusters
+    tids = self.tids[s > 1.0]
+
+    # collect scores
+    Nt = len(tids)
+    score_cls_tf, score_reg_tf = score_tids_tf[:, :, :Nt], score_tids_tf[:, :, Nt:5*Nt]
+    prob_cls_tf = expit(score_cls_tf)
+
+    # threshold for detection
+    fy, fx, fc = np.where(prob_cls_tf > prob_thresh)
+
+    # interpret heatmap into bounding boxes
+    ft = tids[fc]
+    cy = (fy + offset[0]) * 8 - 1
+    cx = (fx + offset[1]) * 8 - 1
+    ch = clusters[ft, 3] - clusters[ft, 1] + 1
+    cw = clusters[ft, 2] - clusters[ft, 0] + 1
+
+    # extract bounding box refinement
+    tx = score_reg_tf[:, :, 0:Nt]
+    ty = score_reg_tf[:, :, Nt:2*Nt]
+    tw = score_reg_tf[:, :, 2*Nt:3*Nt]
+    th = score_reg_tf[:, :, 3*Nt:4*Nt]
+
+    # refine bounding boxes
+    dcx = cw * tx[fy, fx, fc]
+    dcy = ch * ty[fy, fx, fc]
+    rcx = cx + dcx
+    rcy = cy + dcy
+    rcw = cw * np.exp(tw[fy, fx, fc])
+    rch = ch * np.exp(th[fy, fx, fc])
+
+    scores = score_cls_tf[fy, fx, fc]
+    tmp_bboxes = np.vstack((rcx - rcw / 2, rcy - rch / 2, rcx + rcw / 2, rcy + rch / 2))
+    tmp_bboxes = np.vstack((tmp_bboxes / s, scores))
+    tmp_bboxes = tmp_bboxes.transpose()
+    return tmp_bboxes
+
+  def detect(self, image, prob_thresh=None, nms_thresh=None, nms_backend=None, approximate=False, print_=0):
+    """
+    Detect faces in one image.
+    :param image: RGB image
+    :param prob_thresh: The threshold of detection confidence, the one of the detector if None.
+    :param nms_thresh: The overlap threshold of non maximum suppression, the one of the detector if None.
+    :param nms_backend: Non maximum suppression implementation of mtcnn.nms, the one of the detector if None.
+    :param approximate: Run the trunk of the model only at the scales where faces are found on
+          resampled features, see detect_many().
+    :param print_: 0 for no print, 2 to print the batches being processed
+    :return: array of bounding boxes [x1, y1, x2, y2, score] after non maximum suppression
+    """
+    return self.detect_many([image], prob_thresh, nms_thresh, nms_backend, approximate=approximate, print_=print_)[0]
+
+  def detect_many(self, images, prob_thresh=None, nms_thresh=None, nms_backend=None,
+                  batch_size=BATCH_SIZE, approximate=False, print_=0):
+    """
+    Detect faces in several images. The inputs of all the images and scales falling in the same
+    bucket of shapes are padded to a common shape and run through the net together.
+
+    In the approximate mode, the trunk of the model is run once per image, at the scale the closest
+    to 1. Its features are resampled to the other scales and scored, and the trunk is only run at
+    the scales where faces are found this way. The boxes all come from the exact scores, but the
+    faces missed on the resampled features are lost.
+    :param images: list of RGB images
+    :param prob_thresh: The threshold of detection confidence, the one of the detector if None.
+    :param nms_thresh: The overlap threshold of non maximum suppression, the one of the detector if None.
+    :param nms_backend: Non maximum suppression implementation of mtcnn.nms, the one of the detector if None.
+    :param batch_size: Maximum number of inputs run through the net at once.
+    :param approximate: Run the trunk only at the scales where faces are found on resampled features.
+    :param print_: 0 for no print, 2 to print the batches being processed
+    :return: list of arrays of bounding boxes [x1, y1, x2, y2, score], one per image
+    """
+    prob_thresh = self.prob_thresh if prob_thresh is None else prob_thresh
+    nms_thresh = self.nms_thresh if nms_thresh is None else nms_thresh
+    nms_backend = self.nms_backend if nms_backend is None else nms_backend
+
+    scales = [self._calc_scales(image) for image in images]
+    if not approximate:
+      bboxes = self._run_scales(images, scales, prob_thresh, batch_size, print_)
+    else:
+      base_scales = [[image_scales[np.argmin(np.abs(np.log2(image_scales)))]] for image_scales in scales]
+
+      # scales at which faces are found on the resampled features of the base scale, looked for
+      # as soon as the features of an image are computed, so that they are not all kept at once
+      exact_scales = [[] for _ in images]
+      def find_scales(i, base_scale, features):
+        exact_scales[i] = [s for s in scales[i] if s != base_scale and
+                           len(self._calc_resampled_bounding_boxes(images[i], features, s, prob_thresh))]
+        if print_ == 2:
+          print("Running the trunk at scales {} besides {:.4f}".format(
+            ", ".join("{:.4f}".format(s) for s in exact_scales[i]), base_scale))
+
+      bboxes = self._run_scales(images, base_scales, prob_thresh, batch_size, print_, features_callback=find_scales)
+      exact_bboxes = self._run_scales(images, exact_scales, prob_thresh, batch_size, print_)
+      bboxes = [image_bboxes + image_exact_bboxes for image_bboxes, image_exact_bboxes in zip(bboxes, exact_bboxes)]
+
+    refined_bboxes = []
+    for image_bboxes in bboxes:
+      image_bboxes = np.vstack([np.empty(shape=(0, 5))] + [b for _, b in sorted(image_bboxes, key=lambda x: x[0])])
+
+      # non maximum suppression
+      refind_idx = nms(image_bboxes, nms_thresh, backend=nms_backend, pixel_offset=0)
+      refined_bboxes.append(image_bboxes[refind_idx])
+    return refined_bboxes
+
+  def _scale_input(self, image, s):
+    """
+    Resize an image at a scale and subtract the average image, as it is run through the net.
+    :param image: RGB image
+    :param s: scale
+    :return: float32 input
+    """
+    img = cv2.resize(image.astype(np.float32), (0, 0), fx=s, fy=s, interpolation=cv2.INTER_LINEAR)
+    img -= self.average_image
+    return img
+
+  def _run_scales(self, images, scales, prob_thresh, batch_size, print_, features_callback=None):
+    """
+    Run the images at some scales through the net, in batches of inputs of similar shapes. The inputs
+    larger than the memory bound are split into tiles. The inputs are only resized when their batch
+    is run, so that the memory taken does not depend on the number of images and scales.
+    :param images: list of RGB images
+    :param scales: list of the scales to run, for each image
+    :param prob_thresh: The threshold of detection confidence.
+    :param batch_size: Maximum number of inputs run through the net at once.
+    :param print_: 0 for no print, 2 to print the batches being processed
+    :param features_callback: Function called with the index of the image, the scale and the
+          features (res3b3, res4b) of the trunk once all the tiles of an input are run, if not None.
+    :return: list of (scale, bounding boxes) for each image
+    """
+    max_pixels = MAX_INFERENCE_MEMORY // BYTES_PER_PIXEL
+
+    # group the tiles of the images at their different scales by templates and bucket of shapes
+    buckets = {}
+    remaining_tiles = {}
+    for i, (image, image_scales) in enumerate(zip(images, scales)):
+      for s in image_scales:
+        # size of the image resized by cv2.resize
+        size = (int(round(image.shape[0] * s)), int(round(image.shape[1] * s)))
+        input_tiles = tiles.calc_tiles(size[0], size[1], max_pixels)
+        if print_ == 2 and len(input_tiles) > 1:
+          print("Splitting the input of {}x{} into {} tiles".format(size[1], size[0], len(input_tiles)))
+        remaining_tiles[(i, s)] = len(input_tiles)
+        for (y0, y1, sy0, sy1), (x0, x1, sx0, sx1) in input_tiles:
+          key = (s > 1.0, -(-(y1 - y0) // BUCKET_SIZE), -(-(x1 - x0) // BUCKET_SIZE))
+          buckets.setdefault(key, []).append((i, s, size, (y0, y1, x0, x1), (sy0, sy1, sx0, sx1)))
+
+    # bounding boxes of each image, by scale
+    bboxes = [[] for _ in images]
+    features = {}
+    # the last input resized, reused by its next tiles
+    scaled_key, scaled_img = None, None
+    for key in sorted(buckets):
+      inputs = buckets[key]
+      key_batch_size = max(1, min(batch_size, max_pixels // (key[1] * key[2] * BUCKET_SIZE ** 2)))
+      for start in range(0, len(inputs), key_batch_size):
+        batch_inputs = inputs[start:start + key_batch_size]
+        h = max(y1 - y0 for _, _, _, (y0, y1, _, _), _ in batch_inputs)
+        w = max(x1 - x0 for _, _, _, (_, _, x0, x1), _ in batch_inputs)
+        if print_ == 2:
+          print("Processing a batch of {} inputs of {}x{}".format(len(batch_inputs), w, h))
+
+        # pad the inputs with the average image, i.e. with zeros once it is subtracted
+        batch = np.zeros((len(batch_inputs), h, w, 3), dtype=np.float32)
+        for j, (i, s, _, (y0, y1, x0, x1), _) in enumerate(batch_inputs):
+          if scaled_key != (i, s):
+            # free the previous input before resizing the next one
+            scaled_img = None
+            scaled_key, scaled_img = (i, s), self._scale_input(images[i], s)
+          batch[j, :y1 - y0, :x1 - x0] = scaled_img[y0:y1, x0:x1]
+
+        # run through the net
+        if features_callback is not None:
+          score_tids_tf, res3b3_tf, res4b_tf = self.sess.run([self.score_tids[key[0]], self.res3b3, self.res4b],
+                                                             feed_dict={self.x: batch})
+        else:
+          score_tids_tf = self.sess.run(self.score_tids[key[0]], feed_dict={self.x: batch})
+
+        # unpack the scores of each input, keeping the ones of its part of the score map of the whole
+        # input, i.e. without the ones of the padding and of the margins of the tiles
+        for j, (i, s, size, (y0, _, x0, _), (sy0, sy1, sx0, sx1)) in enumerate(batch_inputs):
+          tile_score = score_tids_tf[j, sy0 - y0 // 8:sy1 - y0 // 8, sx0 - x0 // 8:sx1 - x0 // 8]
+          tmp_bboxes = self._calc_bounding_boxes(tile_score, s, prob_thresh, (sy0, sx0))
+          bboxes[i].append((s, tmp_bboxes))
+          if features_callback is not None:
+            if (i, s) not in features:
+              (res3_h, res4_h), (res3_w, res4_w) = tiles.trunk_sizes(size[0]), tiles.trunk_sizes(size[1])
+              features[(i, s)] = (np.empty((res3_h, res3_w, res3b3_tf.shape[3]), dtype=np.float32),
+                                  np.empty((res4_h, res4_w, res4b_tf.shape[3]), dtype=np.float32))
+            res3b3, res4b = features[(i, s)]
+            (res3_y, res4_y) = tiles.tile_features(size[0], sy0, sy1)
+            (res3_x, res4_x) = tiles.tile_features(size[1], sx0, sx1)
+            res3b3[res3_y, res3_x] = res3b3_tf[j, tiles.shift(res3_y, y0 // 8), tiles.shift(res3_x, x0 // 8)]
+            res4b[res4_y, res4_x] = res4b_tf[j, tiles.shift(res4_y, y0 // 16), tiles.shift(res4_x, x0 // 16)]
+            remaining_tiles[(i, s)] -= 1
+            if remaining_tiles[(i, s)] == 0:
+              features_callback(i, s, features.pop((i, s)))
+    return bboxes
+
+  def _calc_resampled_bounding_boxes(self, image, features, s, prob_thresh):
+    """
+    Approximate the bounding boxes of an image at a scale from the features of another scale. The
+    resampled features larger than the memory bound are split into tiles, each one resampled from
+    the part of the features it covers.
+    :param image: RGB image
+    :param features: res3b3 and res4b features of the image at another scale
+    :param s: scale at which the features are resampled
+    :param prob_thresh: The threshold of detection confidence.
+    :return: bounding boxes [x1, y1, x2, y2, score] in the coordinates of the raw image
+    """
+    res3b3, res4b = features
+    # size of the image resized by cv2.resize
+    size = (int(round(image.shape[0] * s)), int(round(image.shape[1] * s)))
+    (res3_h, res4_h), (res3_w, res4_w) = tiles.trunk_sizes(size[0]), tiles.trunk_sizes(size[1])
+
+    bboxes = [np.empty(shape=(0, 5))]
+    for (y0, y1, sy0, sy1), (x0, x1, sx0, sx1) in tiles.calc_tiles(size[0], size[1],
+                                                                   MAX_INFERENCE_MEMORY // BYTES_PER_PIXEL):
+      (res3_th, res4_th), (res3_tw, res4_tw) = tiles.trunk_sizes(y1 - y0), tiles.trunk_sizes(x1 - x0)
+      res3_y = tiles.resampled_features(y0 // 8, res3_th, res3b3.shape[0], res3_h)
+      res3_x = tiles.resampled_features(x0 // 8, res3_tw, res3b3.shape[1], res3_w)
+      res4_y = tiles.resampled_features(y0 // 16, res4_th, res4b.shape[0], res4_h)
+      res4_x = tiles.resampled_features(x0 // 16, res4_tw, res4b.shape[1], res4_w)
+      score_tids_tf = self.sess.run(self.score_resampled[s > 1.0],
+                                    feed_dict={self.res3b3: res3b3[np.newaxis, res3_y, res3_x],
+                                               self.res4b: res4b[np.newaxis, res4_y, res4_x],
+                                               self.res3_size: [res3_th, res3_tw], self.res4_size: [res4_th, res4_tw]})
+      tile_score = score_tids_tf[0, sy0 - y0 // 8:sy1 - y0 // 8, sx0 - x0 // 8:sx1 - x0 // 8]
+      bboxes.append(self._calc_bounding_boxes(tile_score, s, prob_thresh, (sy0, sx0)))
+    return np.vstack(bboxes)
+
+
+# detectors already built by evaluate(), by weight file
+_detectors = {}
+
+def get_detector(weight_file_path):
+  """
+  Get the detector of a weight file, building it on the first call only.
+  :param weight_file_path: A pretrained weight file in the pickle format
+        generated by matconvnet_hr101_to_tf.py.
+  :return: TinyFaceDetector
+  """
+  if weight_file_path not in _detectors:
+    _detectors[weight_file_path] = TinyFaceDetector(weight_file_path)
+  return _detectors[weight_file_path]
+
 def evaluate(weight_file_path,  output_dir=None, data_dir=None, img=None, list_imgs=None,
               prob_thresh=0.5, nms_thresh=0.1, lw=3, display=False, 
-              draw=True, save=True, print_=0):
+              draw=True, save=True, print_=0, nms_backend='numpy', detector=None, batch_size=BATCH_SIZE,
+              approximate=False, times=None):
   """ 
   Detect faces in images.
   :param weight_file_path: A pretrained weight file in the pickle format 
@@ -38,6 +390,14 @@ def evaluate(weight_file_path,  output_dir=None, data_dir=None, img=None, list_i
   :param draw: Draw bouding boxes on images.
   :param save: Save images in output_dir.
   :param print_: 0 for no print, 1 for light print, 2 for full print
+  :param nms_backend: Non maximum suppression implementation of mtcnn.nms ('numpy', 'grid' or 'numba').
+  :param detector: TinyFaceDetector to use. By default, the one of weight_file_path is built
+        on the first call and reused by the next ones.
+  :param batch_size: Number of pictures processed together, and maximum number of inputs run through the net at once.
+  :param approximate: Run the trunk of the model only at the scales where faces are found on
+        resampled features, see TinyFaceDetector.detect_many().
+  :param times: A list to which the detection time of each picture is appended, in seconds
+        (the pictures processed together share their time), e.g. for metrics.compute_stats.
   :return: final bboxes
   """
   if type(img) != np.ndarray:
@@ -51,26 +411,9 @@ def evaluate(weight_file_path,  output_dir=None, data_dir=None, img=None, list_i
 
   # list of bounding boxes for the pictures
   final_bboxes = []
-    
-  # placeholder of input images. Currently batch size of one is supported.
-  x = tf.placeholder(tf.float32, [1, None, None, 3]) # n, h, w, c
-
-  # Create the tiny face model which weights are loaded from a pretrained model.
-  model = tiny_model.Model(weight_file_path)
-  score_final = model.tiny_face(x)
-
-  # Load an average image and clusters(reference boxes of templates).
-  with open(weight_file_path, "rb") as f:
-    _, mat_params_dict = pickle.load(f)
-
-  # Average RGB values from model
-  average_image = model.get_data_by_key("average_image")
-  
-  # Reference boxes of template for 05x, 1x, and 2x scale
-  clusters = model.get_data_by_key("clusters")
-  clusters_h = clusters[:, 3] - clusters[:, 1] + 1
-  clusters_w = clusters[:, 2] - clusters[:, 0] + 1
-  normal_idx = np.where(clusters[:, 4] == 1)
+
+  if detector is None:
+    detector = get_detector(weight_file_path)
 
   # Find image files in data_dir.
   filenames = []
@@ -83,10 +426,10 @@ def evaluate(weight_file_path,  output_dir=None, data_dir=None, img=None, list_i
       for ext in ('*.png', '*.gif', '*.jpg', '*.jpeg'):
         filenames.extend(glob.glob(os.path.join(data_dir, ext)))
 
-  # main
-  with tf.Session() as sess:
-    sess.run(tf.global_variables_initializer())
-    for filename in filenames:
+  # main, the pictures being processed by chunks of batch_size
+  for chunk_start in range(0, len(filenames), batch_size):
+    fnames, raw_imgs = [], []
+    for filename in filenames[chunk_start:chunk_start + batch_size]:
       # if we provide only one picture, no need to list files in dir
       if not one_pic and type(list_imgs) != list:
           fname = filename.split(os.sep)[-1]
@@ -95,97 +438,25 @@ def evaluate(weight_file_path,  output_dir=None, data_dir=None, img=None, list_i
       else:
           fname = 'current_picture'
           raw_img = filename
-      raw_img_f = raw_img.astype(np.float32)
-      
-      def _calc_scales():
-        """
-        Compute the different scales for detection
-        :return: [2^X] with X depending on the input image
-        """
-        raw_h, raw_w = raw_img.shape[0], raw_img.shape[1]
-        min_scale = min(np.floor(np.log2(np.max(clusters_w[normal_idx] / raw_w))),
-                        np.floor(np.log2(np.max(clusters_h[normal_idx] / raw_h))))
-        max_scale = min(1.0, -np.log2(max(raw_h, raw_w) / MAX_INPUT_DIM))
-        scales_down = pl.frange(min_scale, 0, 1.)
-        scales_up = pl.frange(0.5, max_scale, 0.5)
-        scales_pow = np.hstack((scales_down, scales_up))
-        scales = np.power(2.0, scales_pow)
-        return scales
-
-      scales = _calc_scales()
-      start = time.time()
-
-      # initialize output
-      bboxes = np.empty(shape=(0, 5))
-
-      # process input at different scales
-      for s in scales:
-        if print_ == 2:
-            print("Processing {} at scale {:.4f}".format(fname, s))
-        img = cv2.resize(raw_img_f, (0, 0), fx=s, fy=s, interpolation=cv2.INTER_LINEAR)
-        img = img - average_image
-        img = img[np.newaxis, :]
-
-        # we don't run every template on every scale ids of templates to ignore
-        tids = list(range(4, 12)) + ([] if s <= 1.0 else list(range(18, 25)))
-        ignoredTids = list(set(range(0, clusters.shape[0])) - set(tids))
+      fnames.append(fname)
+      raw_imgs.append(raw_img)
 
-        # run through the net
-        score_final_tf = sess.run(score_final, feed_dict={x: img})
-
-        # collect scores
-        score_cls_tf, score_reg_tf = score_final_tf[:, :, :, :25], score_final_tf[:, :, :, 25:125]
-        prob_cls_tf = expit(score_cls_tf)
-        prob_cls_tf[0, :, :, ignoredTids] = 0.0
-
-        def _calc_bounding_boxes():
-          # threshold for detection
-          _, fy, fx, fc = np.where(prob_cls_tf > prob_thresh)
-
-          # interpret heatmap into bounding boxes
-          cy = fy * 8 - 1
-          cx = fx * 8 - 1
-          ch = clusters[fc, 3] - clusters[fc, 1] + 1
-          cw = clusters[fc, 2] - clusters[fc, 0] + 1
-
-          # extract bounding box refinement
-          Nt = clusters.shape[0]
-          tx = score_reg_tf[0, :, :, 0:Nt]
-          ty = score_reg_tf[0, :, :, Nt:2*Nt]
-          tw = score_reg_tf[0, :, :, 2*Nt:3*Nt]
-          th = score_reg_tf[0, :, :, 3*Nt:4*Nt]
-
-          # refine bounding boxes
-          dcx = cw * tx[fy, fx, fc]
-          dcy = ch * ty[fy, fx, fc]
-          rcx = cx + dcx
-          rcy = cy + dcy
-          rcw = cw * np.exp(tw[fy, fx, fc])
-          rch = ch * np.exp(th[fy, fx, fc])
-
-          scores = score_cls_tf[0, fy, fx, fc]
-          tmp_bboxes = np.vstack((rcx - rcw / 2, rcy - rch / 2, rcx + rcw / 2, rcy + rch / 2))
-          tmp_bboxes = np.vstack((tmp_bboxes / s, scores))
-          tmp_bboxes = tmp_bboxes.transpose()
-          return tmp_bboxes
-
-        tmp_bboxes = _calc_bounding_boxes()
-        bboxes = np.vstack((bboxes, tmp_bboxes)) # <class 'tuple'>: (5265, 5)
-
-      if print_ >= 1:
-          print("time {:.2f} secs for {}".format(time.time() - start, fname))
+    if print_ == 2:
+        print("Processing {}".format(", ".join(fnames)))
+    start = time.time()
+    chunk_bboxes = detector.detect_many(raw_imgs, prob_thresh, nms_thresh, nms_backend, batch_size,
+                                        approximate, print_)
+    chunk_time = time.time() - start
+    if print_ >= 1:
+        print("time {:.2f} secs for {}".format(chunk_time, ", ".join(fnames)))
+    if times is not None:
+        times.extend([chunk_time / len(fnames)] * len(fnames))
 
-      # non maximum suppression
-      refind_idx = tf.image.non_max_suppression(tf.convert_to_tensor(bboxes[:, :4], dtype=tf.float32),
-                                                   tf.convert_to_tensor(bboxes[:, 4], dtype=tf.float32),
-                                                   max_output_size=bboxes.shape[0], iou_threshold=nms_thresh)
-      refind_idx = sess.run(refind_idx)
-      refined_bboxes = bboxes[refind_idx]
-      
+    for fname, raw_img, refined_bboxes in zip(fnames, raw_imgs, chunk_bboxes):
       # convert bbox coordinates to int
       # f_box = overlay_bounding_boxes(raw_img, refined_bboxes, lw, draw)
-      f_box = [[int(x) for x in r[:4] for r in refined_bboxes]]
-      
+      f_box = [[int(x) for x in r[:4]] for r in refined_bboxes]
+
       if display:
         # plt.axis('off')
         plt.imshow(raw_img)
@@ -195,7 +466,7 @@ def evaluate(weight_file_path,  output_dir=None, data_dir=None, img=None, list_i
         # save image with bounding boxes
         raw_img = cv2.cvtColor(raw_img, cv2.COLOR_RGB2BGR)
         cv2.imwrite(os.path.join(output_dir, fname), raw_img)
-      
+
       final_bboxes.append(f_box)
 
   if len(final_bboxes) == 1:
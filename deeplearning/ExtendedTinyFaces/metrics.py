@@ -93,7 +93,7 @@ def mean_jaccard(truth_boxes, predicted_boxes, only_tp=True, blurred=0):
     if len(l) > 0:
         return np.mean(l), len(l)
 
-def compute_stats(data_dir, truth, predictions, blurred=0):
+def compute_stats(data_dir, truth, predictions, blurred=0, times=None):
     """
     Compute the mean Jaccard distance and the ratio of predicted bounding
     boxes compared to the number of actual bounding boxes
@@ -103,6 +103,8 @@ def compute_stats(data_dir, truth, predictions, blurred=0):
     :param predictions: list of predicted bounding boxes 
             keeping the same order of glob.glob(pictures folder)
     :param blurred: 0 for all faces, 1 for normal blurred faces, 2 for heavy blurred faces
+    :param times: list of the detection times of the pictures in seconds, in the order of predictions
+            (e.g. filled by evaluate.evaluate), added to the DataFrame as 'Time' if given
     :return: (len(pictures), 4) numpy array and the corresponding panda DataFrame
             ['mean Jaccard', 'Nb_Truth_Bboxes', 'Nb_Pred_Bboxes', 'Ratio_Bboxes']
     """
@@ -128,4 +130,6 @@ def compute_stats(data_dir, truth, predictions, blurred=0):
     a[:,3] = a[:,2]/a[:,1]
     df = pd.DataFrame(a, columns=['mJaccard', 'Nb_Truth_Bboxes', 'Nb_Pred_Bboxes', 'Ratio_Bboxes'])
     df['Folder'] = data_dir.replace(data_folder, '')
+    if times is not None:
+        df['Time'] = times
     return a, df
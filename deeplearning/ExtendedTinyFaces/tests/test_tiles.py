@@ -0,0 +1,98 @@
+import unittest
+import numpy as np
+
+import tiles
+
+
+class TestTiles(unittest.TestCase):
+
+  def test_score_map_size(self):
+    """
+    The score map has one score per stride 8 of the input, upsampled from the stride 16 of res4b.
+    :return:
+    """
+    for size in range(1, 2000):
+      size_res3, size_res4 = tiles.trunk_sizes(size)
+      self.assertEqual(size_res3, -(-size // 8))
+      self.assertEqual(size_res4, -(-size // 16))
+      self.assertEqual(tiles.score_map_size(size), 2 * size_res4 - 1)
+
+  def test_tile_ranges(self):
+    """
+    The ranges are aligned on the stride 16 of the trunk, keep their margins and their kept scores
+    partition the score map of the whole input.
+    :return:
+    """
+    min_size = 2 * tiles.TILE_MARGIN + 32
+    for size in list(range(1, 3000, 37)) + [4096, 5000, 10000]:
+      for max_size in (min_size, min_size + 15, 1000, 1500, 2048, size):
+        if max_size < min_size and max_size < size:
+          continue
+        ranges = tiles.tile_ranges(size, max_size)
+        score_end = 0
+        for start, end, score_start, score_end_tile in ranges:
+          self.assertEqual(start % 16, 0)
+          self.assertLessEqual(end - start, max_size)
+          self.assertEqual(score_start, score_end)
+          self.assertGreater(score_end_tile, score_start)
+          self.assertTrue(start == 0 or score_start * 8 - start >= tiles.TILE_MARGIN)
+          self.assertTrue(end == size or end - score_end_tile * 8 >= tiles.TILE_MARGIN)
+          # the tiles have the size of the input modulo 16
+          self.assertTrue(end == size or (end - start) % 16 == size % 16)
+          score_end = score_end_tile
+        self.assertEqual(score_end, tiles.score_map_size(size))
+        self.assertEqual(len(ranges) == 1, size <= max_size)
+
+  def test_calc_tiles(self):
+    """
+    The tiles fit in the memory bound and their kept scores cover the score map of the whole input once.
+    :return:
+    """
+    for height, width, max_pixels in ((500, 700, 1000 * 1000), (1400, 900, 1000 * 1000), (2800, 1800, 1000 * 1000),
+                                      (2160, 3840, 2 * 1024 ** 3 // 256), (4320, 7680, 2 * 1024 ** 3 // 256),
+                                      (1000, 9000, 1200 * 1200)):
+      input_tiles = tiles.calc_tiles(height, width, max_pixels)
+      coverage = np.zeros((tiles.score_map_size(height), tiles.score_map_size(width)), dtype=np.int32)
+      for (y0, y1, sy0, sy1), (x0, x1, sx0, sx1) in input_tiles:
+        self.assertLessEqual((y1 - y0) * (x1 - x0), max_pixels)
+        self.assertEqual((y0 % 16, x0 % 16), (0, 0))
+        coverage[sy0:sy1, sx0:sx1] += 1
+      self.assertTrue(np.all(coverage == 1))
+      self.assertEqual(len(input_tiles) == 1, height * width <= max_pixels)
+
+    with self.assertRaises(ValueError):
+      tiles.calc_tiles(3000, 3000, 500 * 500)
+
+  def test_tile_features(self):
+    """
+    The features computed by the tiles cover the features of the whole input once.
+    :return:
+    """
+    for size, max_size in ((1000, 1000), (2800, 1000), (5000, 2048), (3001, 1200)):
+      size_res3, size_res4 = tiles.trunk_sizes(size)
+      coverage_res3, coverage_res4 = np.zeros(size_res3, dtype=np.int32), np.zeros(size_res4, dtype=np.int32)
+      for start, end, score_start, score_end in tiles.tile_ranges(size, max_size):
+        res3, res4 = tiles.tile_features(size, score_start, score_end)
+        coverage_res3[res3] += 1
+        coverage_res4[res4] += 1
+        # the features are computed by the tile
+        self.assertGreaterEqual(res3.start, start // 8)
+        self.assertLessEqual(res3.stop - start // 8, tiles.trunk_sizes(end - start)[0])
+        self.assertLessEqual(res4.stop - start // 16, tiles.trunk_sizes(end - start)[1])
+      self.assertTrue(np.all(coverage_res3 == 1))
+      self.assertTrue(np.all(coverage_res4 == 1))
+
+  def test_resampled_features(self):
+    """
+    The part of the features resampled into a part of another size covers it, and all of them for the whole part.
+    :return:
+    """
+    self.assertEqual(tiles.resampled_features(0, 250, 125, 250), slice(0, 125))
+    self.assertEqual(tiles.resampled_features(0, 63, 125, 63), slice(0, 125))
+    self.assertEqual(tiles.resampled_features(100, 50, 125, 250), slice(50, 75))
+    self.assertEqual(tiles.resampled_features(101, 50, 125, 250), slice(50, 76))
+    self.assertEqual(tiles.resampled_features(200, 63, 125, 250), slice(100, 125))
+
+
+if __name__ == '__main__':
+  unittest.main()
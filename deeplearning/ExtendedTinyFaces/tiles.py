@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+# the receptive field of the score maps is 851 pixels wide: the scores are kept at TILE_MARGIN pixels
+# from the inner borders of the tiles, where they are the same as on the whole input
+TILE_MARGIN = 448
+
+
+def trunk_sizes(size):
+  """
+  Sizes of the features of the trunk along a dimension of its input.
+  :param size: height or width of the input
+  :return: height or width of res3b3 and res4b
+  """
+  # res3b3 and res4b have strides of 8 and 16
+  size_res3 = int(np.ceil(size / 8.0))
+  return size_res3, int(np.ceil(size_res3 / 2.0))
+
+def score_map_size(size):
+  """
+  Size of the score map of the model along a dimension of its input.
+  :param size: height or width of the input
+  :return: height or width of the score map
+  """
+  # score4 upsamples by 2 the stride 16 of score_res4
+  _, size_res4 = trunk_sizes(size)
+  return 2 * size_res4 - 1
+
+def calc_tiles(height, width, max_pixels):
+  """
+  Split an input into overlapping tiles of at most max_pixels pixels, if it is larger.
+  :param height: height of the input
+  :param width: width of the input
+  :param max_pixels: maximum number of pixels of a tile
+  :return: list of tiles, each one given as ((y0, y1, sy0, sy1), (x0, x1, sx0, sx1)): the rows and
+        columns of the input run, and the ones of the score map of the whole input kept
+  """
+  if height * width <= max_pixels:
+    return [(tile_ranges(height, height)[0], tile_ranges(width, width)[0])]
+
+  # tiles as high as the input, as wide as the input or square: the ones running the fewest pixels
+  side = int(np.sqrt(max_pixels))
+  candidates = []
+  for max_height, max_width in ((height, max_pixels // height), (max_pixels // width, width), (side, side)):
+    # the tiles of a split dimension must be larger than their margins
+    if all(max_size >= size or max_size >= 2 * TILE_MARGIN + 32
+           for size, max_size in ((height, max_height), (width, max_width))):
+      tiles = [(y, x) for y in tile_ranges(height, max_height) for x in tile_ranges(width, max_width)]
+      candidates.append((sum((y1 - y0) * (x1 - x0) for (y0, y1, _, _), (x0, x1, _, _) in tiles), tiles))
+  if not candidates:
+    raise ValueError("MAX_INFERENCE_MEMORY is too small for tiles larger than their margins of {} pixels"
+                     .format(TILE_MARGIN))
+  return min(candidates, key=lambda candidate: candidate[0])[1]
+
+def tile_ranges(size, max_size):
+  """
+  Split a dimension of an input into overlapping ranges of at most max_size pixels.
+  :param size: height or width of the input
+  :param max_size: maximum height or width of a tile
+  :return: list of (start, end, score_start, score_end): the range of the input run, and the range of
+        the score map of the whole input kept
+  """
+  size_score = score_map_size(size)
+  if size <= max_size:
+    return [(0, size, 0, size_score)]
+
+  # the scores kept of each tile, an even number of them for the tiles to start on the stride 16 of the trunk
+  score_tile_size = (max_size - 2 * TILE_MARGIN - 16) // 16 * 2
+  ranges = []
+  for score_start in range(0, size_score, score_tile_size):
+    score_end = min(score_start + score_tile_size, size_score)
+    start = max(0, score_start * 8 - TILE_MARGIN)
+    # the tiles have the size of the input modulo 16, for the SAME padding of the
+    # max pooling to be the same
+    end = min(size, score_end * 8 + TILE_MARGIN + size % 16)
+    ranges.append((start, end, score_start, score_end))
+  return ranges
+
+def tile_features(size, score_start, score_end):
+  """
+  Parts of the features of the trunk of the whole input computed by a tile.
+  :param size: height or width of the input
+  :param score_start: start of the range of the score map kept from the tile
+  :param score_end: end of the range of the score map kept from the tile
+  :return: the slices of res3b3 and res4b of the whole input
+  """
+  size_res3, size_res4 = trunk_sizes(size)
+  if score_end == score_map_size(size):
+    # the last tile also gives the features beyond the score map
+    return slice(score_start, size_res3), slice(score_start // 2, size_res4)
+  return slice(score_start, score_end), slice(score_start // 2, score_end // 2)
+
+def resampled_features(start, size, features_size, resampled_size):
+  """
+  Part of features needed to compute a part of their resampling to another size.
+  :param start: start of the part of the resampled features
+  :param size: size of the part of the resampled features
+  :param features_size: height or width of the features
+  :param resampled_size: height or width of the resampled features
+  :return: the slice of the features
+  """
+  ratio = features_size / float(resampled_size)
+  return slice(int(np.floor(start * ratio)), min(features_size, int(np.ceil((start + size) * ratio))))
+
+def shift(s, offset):
+  """Shift a slice by an offset."""
+  return slice(s.start - offset, s.stop - offset)
@@ -27,12 +27,14 @@ class Model():
       assert key in self.mat_params_dict, "key: " + key + " not found."
       return self.mat_params_dict[key]
 
-    def _weight_variable_on_cpu(self, name, shape):
+    def _weight_variable_on_cpu(self, name, shape, channels=None, filters=None):
       """Helper to create a weight Variable stored on CPU memory.
 
       Args:
         name: name of the variable.
         shape: list of ints: (height, width, channel, filter).
+        channels: indices of the channels to keep, all of them if None.
+        filters: indices of the filters to keep, all of them if None.
 
       Returns:
         initializer for Variable.
@@ -40,6 +42,10 @@ class Model():
       assert len(shape) == 4
 
       weights = self.get_data_by_key(name + "_filter")  # (h, w, channel, filter)
+      if channels is not None:
+        weights = weights[:, :, channels, :]
+      if filters is not None:
+        weights = weights[:, :, :, filters]
       assert list(weights.shape) == shape
       initializer = tf.constant_initializer(weights, dtype=self.dtype)
 
@@ -47,18 +53,21 @@ class Model():
         var = tf.get_variable(name + "_w", shape, initializer=initializer, dtype=self.dtype)
       return var
 
-    def _bias_variable_on_cpu(self, name, shape):
+    def _bias_variable_on_cpu(self, name, shape, filters=None):
       """Helper to create a bias Variable stored on CPU memory.
 
       Args:
         name: name of the variable.
         shape: int, filter size.
+        filters: indices of the filters to keep, all of them if None.
 
       Returns:
         initializer for Variable.
       """
       assert isinstance(shape, int)
       bias = self.get_data_by_key(name + "_bias")
+      if filters is not None:
+        bias = bias[filters]
       assert len(bias) == shape
       initializer = tf.constant_initializer(bias, dtype=self.dtype)
 
@@ -102,7 +111,7 @@ class Model():
 
 
     def conv_block(self, bottom, name, shape, strides=[1,1,1,1], padding="SAME",
-                   has_bias=False, add_relu=True, add_bn=True, eps=1.0e-5):
+                   has_bias=False, add_relu=True, add_bn=True, eps=1.0e-5, channels=None, filters=None):
       """Create a block composed of multiple layers:
             a conv layer
             a batch normalization layer
@@ -118,15 +127,17 @@ class Model():
         add_relu: Whether a ReLU layer is added.
         add_bn: Whether a batch normalization layer is added.
         eps: A small float number to avoid dividing by 0, used in a batch normalization layer.
+        channels: Indices of the input channels of the pretrained filters to keep, all of them if None.
+        filters: Indices of the pretrained filters to keep, all of them if None.
       Returns:
         a block of layers
       """
       assert len(shape) == 4
 
-      weight = self._weight_variable_on_cpu(name, shape)
+      weight = self._weight_variable_on_cpu(name, shape, channels, filters)
       conv = tf.nn.conv2d(bottom, weight, strides, padding=padding)
       if has_bias:
-        bias = self._bias_variable_on_cpu(name, shape[3])
+        bias = self._bias_variable_on_cpu(name, shape[3], filters)
 
       pre_activation = tf.nn.bias_add(conv, bias) if has_bias else conv
 
@@ -140,7 +151,8 @@ class Model():
       return relu
 
 
-    def conv_trans_layer(self, bottom, name, shape, strides=[1,1,1,1], padding="SAME", has_bias=False):
+    def conv_trans_layer(self, bottom, name, shape, strides=[1,1,1,1], padding="SAME", has_bias=False,
+                         channels=None, filters=None):
       """Create a block composed of multiple layers:
             a transpose of conv layer
             an activation layer
@@ -153,13 +165,17 @@ class Model():
         padding: Padding of conv layer.
         has_bias: Whether a bias term is added.
         add_relu: Whether a ReLU layer is added.
+        channels: Indices of the output channels of the pretrained filters to keep, all of them if None.
+        filters: Indices of the pretrained filters (input channels) to keep, all of them if None.
       Returns:
         a block of layers
       """
       assert len(shape) == 4
 
-      weight = self._weight_variable_on_cpu(name, shape)
-      nb, h, w, nc = tf.split(tf.shape(bottom), num_or_size_splits=4)
+      # the filters of a transposed conv are (height, width, output channel, input channel)
+      weight = self._weight_variable_on_cpu(name, shape, channels, filters)
+      nb, h, w, _ = tf.split(tf.shape(bottom), num_or_size_splits=4)
+      nc = tf.constant([shape[2]])
       output_shape = tf.stack([nb, (h - 1) * strides[1] - 3 + shape[0], (w - 1) * strides[2] - 3 + shape[1], nc])[:, 0]
       conv = tf.nn.conv2d_transpose(bottom, weight, output_shape, strides, padding=padding)
       if has_bias:
@@ -203,6 +219,17 @@ class Model():
         Returns:
           a score tensor
         """
+        res3b3, res4b = self.tiny_face_trunk(image)
+        return self.tiny_face_score(res3b3, res4b)
+
+    def tiny_face_trunk(self, image):
+        """Create the ResNet-101 trunk of the tiny face model.
+
+        Args:
+          image: an input image.
+        Returns:
+          the res3b3 and res4b22 feature tensors, of strides 8 and 16
+        """
         img = tf.pad(image, [[0, 0], [3, 3], [3, 3], [0, 0]], "CONSTANT")
         conv = self.conv_block(img, 'conv1', shape=[7, 7, 3, 64], strides=[1, 2, 2, 1], padding="VALID", add_relu=True)
         pool1 = tf.nn.max_pool(conv, ksize=[1, 3, 3, 1], strides=[1, 2, 2, 1], padding='SAME')
@@ -226,11 +253,37 @@ class Model():
         for i in range(1, 23):
           res4b = self.residual_block(res4b, 'res4b' + str(i), 1024, 256, 1024, res4b)
 
-        score_res4 = self.conv_block(res4b, 'score_res4', shape=[1, 1, 1024, 125], padding="VALID",
-                                     has_bias=True, add_relu=False, add_bn=False)
-        score4 = self.conv_trans_layer(score_res4, 'score4', shape=[4, 4, 125, 125], strides=[1, 2, 2, 1], padding="SAME")
-        score_res3 = self.conv_block(res3b3, 'score_res3', shape=[1, 1, 512, 125], padding="VALID",
-                                     has_bias=True, add_bn=False, add_relu=False)
+        return res3b3, res4b
+
+    def tiny_face_score(self, res3b3, res4b, channels=None):
+        """Create the score layers of the tiny face model, on top of its trunk.
+
+        When only some channels of the score are needed, the score layers are built for them only:
+        score_res3 and score4 keep their filters, and score_res4 the filters read by these ones of score4.
+        Several score layers can be built on the same trunk in different variable scopes.
+
+        Args:
+          res3b3: the stride 8 features of the trunk.
+          res4b: the stride 16 features of the trunk.
+          channels: indices of the channels of the score to compute, all the 125 channels if None.
+        Returns:
+          a score tensor
+        """
+        res4_channels = None
+        if channels is not None:
+          channels = np.asarray(channels)
+          # score4 may mix the channels of score_res4: keep the ones read by the kept filters
+          score4_filter = self.get_data_by_key("score4_filter")[:, :, channels, :]
+          res4_channels = np.where(np.any(score4_filter != 0, axis=(0, 1, 2)))[0]
+        n = 125 if channels is None else len(channels)
+        n4 = 125 if res4_channels is None else len(res4_channels)
+
+        score_res4 = self.conv_block(res4b, 'score_res4', shape=[1, 1, 1024, n4], padding="VALID",
+                                     has_bias=True, add_relu=False, add_bn=False, filters=res4_channels)
+        score4 = self.conv_trans_layer(score_res4, 'score4', shape=[4, 4, n, n4], strides=[1, 2, 2, 1], padding="SAME",
+                                       channels=channels, filters=res4_channels)
+        score_res3 = self.conv_block(res3b3, 'score_res3', shape=[1, 1, 512, n], padding="VALID",
+                                     has_bias=True, add_bn=False, add_relu=False, filters=channels)
 
         bs, height, width = tf.split(tf.shape(score4), num_or_size_splits=4)[0:3]
         _size = tf.convert_to_tensor([height[0], width[0]])
@@ -0,0 +1,69 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2019 Iván de Paz Centeno
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+pytest-benchmark entry point of the MTCNN benchmark. The file is not named test_*.py so that it is not collected with
+the unit tests; it runs with:
+
+    $ pytest benchmarks/bench_mtcnn.py --benchmark-json results.json
+"""
+
+import pytest
+
+from benchmarks.mtcnn_benchmark import SIZES, FACE_COUNTS, OPERATIONS, synthetic_image, prepare_operations
+
+pytest.importorskip("pytest_benchmark")
+
+__author__ = "Iván de Paz Centeno"
+
+
+@pytest.fixture(scope="module")
+def detector():
+    from mtcnn import MTCNN
+    return MTCNN()
+
+
+@pytest.fixture(scope="module")
+def prepared(detector):
+    cache = {}
+
+    def prepare(width, height, faces):
+        if (width, height, faces) not in cache:
+            cache[width, height, faces] = prepare_operations(detector, synthetic_image(width, height, faces))
+
+        return cache[width, height, faces]
+
+    return prepare
+
+
+@pytest.mark.parametrize("operation", OPERATIONS)
+@pytest.mark.parametrize("faces", FACE_COUNTS)
+@pytest.mark.parametrize("width,height", SIZES)
+def test_mtcnn(benchmark, prepared, width, height, faces, operation):
+    operations, counts = prepared(width, height, faces)
+
+    benchmark.group = "{}x{} {} faces".format(width, height, faces)
+    benchmark.extra_info.update(counts)
+    benchmark(operations[operation])
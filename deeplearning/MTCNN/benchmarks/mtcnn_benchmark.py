@@ -0,0 +1,238 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2019 Iván de Paz Centeno
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Benchmark of MTCNN on synthetic images, timing separately each part of the detection.
+
+It can be run standalone, writing the results to a JSON file so that they can be compared across releases:
+
+    $ python -m benchmarks.mtcnn_benchmark --output results.json
+
+or through pytest-benchmark (see benchmarks/bench_mtcnn.py):
+
+    $ pytest benchmarks/bench_mtcnn.py --benchmark-json results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import time
+
+import cv2
+import numpy as np
+
+import mtcnn
+from mtcnn import MTCNN
+from mtcnn.mtcnn import StageStatus
+from mtcnn.nms import nms, BACKENDS as NMS_BACKENDS
+from mtcnn.result import to_arrays
+
+__author__ = "Iván de Paz Centeno"
+
+SIZES = [(320, 240), (640, 480), (1280, 720), (1920, 1080), (3840, 2160)]
+FACE_COUNTS = [0, 1, 10, 100, 500]
+OPERATIONS = ["pyramid", "stage1", "stage2", "stage3", "nms", "to_faces", "to_arrays", "detect_faces"]
+
+FACE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ivan.jpg")
+
+
+def synthetic_image(width: int, height: int, faces: int, seed: int = 0):
+    """
+    Builds an image with a blurred noise background and the given number of copies of the face of ivan.jpg, laid out
+    on a grid so that they do not overlap. Faces get smaller as the grid gets denser (between 8 and 110 pixels wide), so
+    dense grids on small images contain faces too small to be detected.
+    :param width: width of the image
+    :param height: height of the image
+    :param faces: number of faces to paste
+    :param seed: seed of the random generator
+    :return: BGR image
+    """
+    rng = np.random.RandomState(seed)
+    image = cv2.GaussianBlur(rng.randint(0, 255, (height, width, 3)).astype(np.uint8), (7, 7), 3)
+
+    if faces == 0:
+        return image
+
+    face = cv2.imread(FACE_FILE)[80:165, 265:340]
+
+    columns = int(np.ceil(np.sqrt(faces * width / height)))
+    rows = int(np.ceil(faces / columns))
+    cell_width, cell_height = width // columns, height // rows
+
+    for index in range(faces):
+        row, column = divmod(index, columns)
+        side = int(np.clip(min(cell_width, cell_height / 85 * 75) * rng.uniform(0.6, 0.9), 8, 110))
+        resized = cv2.resize(face, (side, side * 85 // 75), interpolation=cv2.INTER_AREA)
+
+        y = row * cell_height + rng.randint(0, max(cell_height - resized.shape[0], 0) + 1)
+        x = column * cell_width + rng.randint(0, max(cell_width - resized.shape[1], 0) + 1)
+        image[y:y + resized.shape[0], x:x + resized.shape[1]] = resized[0:height - y, 0:width - x]
+
+    return image
+
+
+def prepare_operations(detector: MTCNN, image, nms_backend: str = None) -> tuple:
+    """
+    Runs once the detection of the image, keeping the input of each part, and builds a callable for each of them.
+    :param detector: MTCNN instance
+    :param image: image to process
+    :param nms_backend: NMS backend to benchmark. By default, the one of the detector.
+    :return: tuple (operations, counts), with a dict of callables without arguments by operation name, and a dict with
+    the number of candidates after each stage.
+    """
+    nms_backend = nms_backend or detector._nms_backend
+    height, width = image.shape[0:2]
+    scales = detector._MTCNN__compute_scales(height, width)
+    status = StageStatus(width=width, height=height)
+
+    stage1 = detector._MTCNN__stage1(image, scales, status)
+    stage2 = detector._MTCNN__stage2(image, *stage1)
+    stage3 = detector._MTCNN__stage3(image, *stage2)
+
+    # Candidates of every scale before any suppression, as the largest input the NMS may get
+    candidates = [np.empty((0, 9))]
+
+    for scale, level in zip(scales, detector._pyramid.build(image, scales)):
+        reg, heatmap = detector._MTCNN__feed_pnet(level)
+        boxes, _ = detector._MTCNN__generate_bounding_box(heatmap.copy(), reg.copy(), scale,
+                                                         detector._steps_threshold[0])
+        candidates.append(boxes.reshape(-1, 9))
+
+    candidates = np.concatenate(candidates)
+
+    operations = {
+        "pyramid": lambda: detector._pyramid.build(image, scales),
+        "stage1": lambda: detector._MTCNN__stage1(image, scales, status),
+        "stage2": lambda: detector._MTCNN__stage2(image, *stage1),
+        "stage3": lambda: detector._MTCNN__stage3(image, *stage2),
+        "nms": lambda: nms(candidates, 0.5, 'Union', backend=nms_backend),
+        "to_faces": lambda: detector._MTCNN__to_faces(*stage3),
+        "to_arrays": lambda: to_arrays(*stage3),
+        "detect_faces": lambda: detector.detect_faces(image),
+    }
+
+    counts = {
+        "nms_candidates": int(candidates.shape[0]),
+        "stage1_boxes": int(stage1[0].shape[0]),
+        "stage2_boxes": int(stage2[0].shape[0]),
+        "detected_faces": int(stage3[0].shape[0]),
+    }
+
+    return operations, counts
+
+
+def time_operation(operation, runs: int) -> dict:
+    """
+    Times an operation, after a warm up call.
+    :return: dict with the statistics of the wall times, in seconds.
+    """
+    operation()
+    times = []
+
+    for _ in range(runs):
+        start = time.perf_counter()
+        operation()
+        times.append(time.perf_counter() - start)
+
+    return {"runs": runs, "min": min(times), "median": float(np.median(times)), "mean": float(np.mean(times)),
+            "max": max(times)}
+
+
+def run(sizes: list = None, face_counts: list = None, operations: list = None, runs: int = 5,
+        nms_backend: str = None, **mtcnn_kwargs) -> dict:
+    """
+    Runs the benchmark.
+    :param sizes: list of (width, height) of the synthetic images.
+    :param face_counts: list with the number of faces of the synthetic images.
+    :param operations: names of the operations to time.
+    :param runs: number of timed runs of each operation.
+    :param nms_backend: NMS backend to benchmark, also used by the detector in the timed stages. By default, the one
+    of the detector.
+    :param mtcnn_kwargs: arguments for the MTCNN instance.
+    :return: dict with the environment and the results, ready to be dumped to JSON.
+    """
+    if nms_backend is not None:
+        mtcnn_kwargs["nms_backend"] = nms_backend
+
+    detector = MTCNN(**mtcnn_kwargs)
+    results = []
+
+    for width, height in sizes or SIZES:
+        for faces in FACE_COUNTS if face_counts is None else face_counts:
+            image = synthetic_image(width, height, faces)
+            prepared, counts = prepare_operations(detector, image, nms_backend)
+
+            for name in operations or OPERATIONS:
+                result = {"width": width, "height": height, "faces": faces, "operation": name}
+                result.update(counts)
+                result.update(time_operation(prepared[name], runs))
+                results.append(result)
+
+    return {
+        "environment": {
+            "mtcnn": mtcnn.__version__,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "mtcnn_kwargs": mtcnn_kwargs,
+            "nms_backend": nms_backend or detector._nms_backend,
+        },
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks MTCNN on synthetic images.")
+    parser.add_argument("--sizes", default=",".join("{}x{}".format(*size) for size in SIZES),
+                        help="comma separated list of image sizes, as WIDTHxHEIGHT")
+    parser.add_argument("--faces", default=",".join(str(count) for count in FACE_COUNTS),
+                        help="comma separated list of face counts")
+    parser.add_argument("--operations", default=",".join(OPERATIONS),
+                        help="comma separated list of operations to time")
+    parser.add_argument("--runs", type=int, default=5, help="number of timed runs of each operation")
+    parser.add_argument("--backend", default="tensorflow", choices=MTCNN.BACKENDS, help="networks backend")
+    parser.add_argument("--nms-backend", default="numpy", choices=list(NMS_BACKENDS), help="NMS backend")
+    parser.add_argument("--output", default="mtcnn_benchmark.json", help="JSON file to write the results to")
+    args = parser.parse_args()
+
+    sizes = [tuple(int(value) for value in size.split("x")) for size in args.sizes.split(",")]
+    face_counts = [int(count) for count in args.faces.split(",")]
+
+    report = run(sizes, face_counts, args.operations.split(","), args.runs, backend=args.backend,
+                 nms_backend=args.nms_backend)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for result in report["results"]:
+        print("{width:>5}x{height:<5} {faces:>4} faces ({detected_faces:>4} detected)  {operation:<13} "
+              "{median:9.5f}s".format(**result))
+
+
+if __name__ == "__main__":
+    main()
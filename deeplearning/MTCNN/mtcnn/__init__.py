@@ -24,6 +24,11 @@
 # SOFTWARE.
 
 from mtcnn.mtcnn import MTCNN
+from mtcnn.pool import MTCNNPool
+from mtcnn.async_mtcnn import AsyncMTCNN
+from mtcnn.video import VideoMTCNN
+from mtcnn.result import FaceList
+from mtcnn.profiling import Profiler
 
 
 __author__ = "Iván de Paz Centeno"
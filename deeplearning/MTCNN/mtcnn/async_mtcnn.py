@@ -0,0 +1,170 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2019 Iván de Paz Centeno
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from mtcnn.exceptions import InvalidImage
+from mtcnn.mtcnn import MTCNN
+
+__author__ = "Iván de Paz Centeno"
+
+
+class AsyncMTCNN(object):
+    """
+    Asyncio front end of MTCNN.
+
+    Concurrent calls to detect() are queued and coalesced into micro-batches, which are processed by
+    MTCNN.detect_faces_batch() in a single background thread, so the event loop is never blocked. A batch is run as
+    soon as it reaches max_batch_size images, or max_wait seconds after its oldest request was queued, which bounds the
+    latency added by the batching.
+    """
+
+    def __init__(self, detector: MTCNN = None, max_batch_size: int = 8, max_wait: float = 0.005, **mtcnn_kwargs):
+        """
+        Initializes the front end.
+        :param detector: MTCNN instance to use. If None, a new instance is built with mtcnn_kwargs.
+        :param max_batch_size: maximum number of images processed in a single batch.
+        :param max_wait: maximum time, in seconds, that a request waits for other requests to fill its batch.
+        :param mtcnn_kwargs: arguments for the MTCNN instance, if detector is None.
+        """
+        self.__detector = detector if detector is not None else MTCNN(**mtcnn_kwargs)
+        self.__max_batch_size = max_batch_size
+        self.__max_wait = max_wait
+        self.__executor = ThreadPoolExecutor(max_workers=1)
+
+        self.__pending = deque()
+        self.__in_flight = []
+        self.__wakeup = None
+        self.__batcher = None
+        self.__loop = None
+
+    def __ensure_batcher(self):
+        loop = asyncio.get_running_loop()
+
+        if self.__loop is not loop or self.__batcher.done():
+            self.__loop = loop
+            self.__wakeup = asyncio.Event()
+            self.__batcher = loop.create_task(self.__run_batches())
+
+    async def detect(self, img) -> list:
+        """
+        Detects bounding boxes from the specified image.
+        :param img: image to process
+        :return: list containing all the bounding boxes detected with their keypoints.
+        """
+        if img is None or not hasattr(img, "shape"):
+            raise InvalidImage("Image not valid.")
+
+        self.__ensure_batcher()
+
+        future = self.__loop.create_future()
+        self.__pending.append((self.__loop.time(), img, future))
+        self.__wakeup.set()
+
+        return await future
+
+    async def __next_batch(self) -> list:
+        """
+        Waits until a batch is full or its oldest request reaches the deadline, and pops it.
+        """
+        while not self.__pending:
+            self.__wakeup.clear()
+            await self.__wakeup.wait()
+
+        deadline = self.__pending[0][0] + self.__max_wait
+
+        while len(self.__pending) < self.__max_batch_size:
+            remaining = deadline - self.__loop.time()
+
+            if remaining <= 0:
+                break
+
+            self.__wakeup.clear()
+
+            try:
+                await asyncio.wait_for(self.__wakeup.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+
+        count = min(len(self.__pending), self.__max_batch_size)
+        return [self.__pending.popleft() for _ in range(count)]
+
+    async def __run_batches(self):
+        while True:
+            batch = [(img, future) for _, img, future in await self.__next_batch() if not future.cancelled()]
+
+            if not batch:
+                continue
+
+            # Kept until the batch is run, so that close() can cancel its requests if it cancels this task meanwhile
+            self.__in_flight = batch
+
+            try:
+                results = await self.__loop.run_in_executor(self.__executor, self.__detector.detect_faces_batch,
+                                                            [img for img, _ in batch])
+            except Exception as e:
+                self.__in_flight = []
+
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.__in_flight = []
+
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    async def close(self):
+        """
+        Stops the batching task and the background thread. Pending requests, including the ones of the batch being
+        run, are cancelled.
+        """
+        if self.__batcher is not None and not self.__batcher.done():
+            self.__batcher.cancel()
+
+            try:
+                await self.__batcher
+            except asyncio.CancelledError:
+                pass
+
+        for _, future in self.__in_flight:
+            future.cancel()
+
+        self.__in_flight = []
+
+        while self.__pending:
+            self.__pending.popleft()[2].cancel()
+
+        self.__executor.shutdown(wait=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
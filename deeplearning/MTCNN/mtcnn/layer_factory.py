@@ -24,7 +24,6 @@
 #SOFTWARE.
 
 import tensorflow as tf
-from distutils.version import LooseVersion
 
 __author__ = "Iván de Paz Centeno"
 
@@ -212,14 +211,9 @@ class LayerFactory(object):
         """
         input_layer = self.__network.get_layer(input_layer_name)
 
-        if LooseVersion(tf.__version__) < LooseVersion("1.5.0"):
-            max_axis = tf.reduce_max(input_tensor=input_layer, axis=axis, keepdims=True)
-            target_exp = tf.exp(input_layer - max_axis)
-            normalize = tf.reduce_sum(input_tensor=target_exp, axis=axis, keepdims=True)
-        else:
-            max_axis = tf.reduce_max(input_tensor=input_layer, axis=axis, keepdims=True)
-            target_exp = tf.exp(input_layer - max_axis)
-            normalize = tf.reduce_sum(input_tensor=target_exp, axis=axis, keepdims=True)
+        max_axis = tf.reduce_max(input_tensor=input_layer, axis=axis, keepdims=True)
+        target_exp = tf.exp(input_layer - max_axis)
+        normalize = tf.reduce_sum(input_tensor=target_exp, axis=axis, keepdims=True)
 
         softmax = tf.math.divide(target_exp, normalize, name)
 
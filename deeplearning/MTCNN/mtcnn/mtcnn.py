@@ -29,15 +29,41 @@
 # It has been rebuilt from scratch, taking the David Sandberg's implementation as a reference.
 #
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+
 import cv2
 import numpy as np
 import pkg_resources
 
 from mtcnn.exceptions import InvalidImage
-from mtcnn.network.factory import NetworkFactory
+from mtcnn.nms import nms, BACKENDS as NMS_BACKENDS
+from mtcnn.profiling import Profiler, NULL_CONTEXT
+from mtcnn.pyramid import ImagePyramid, normalize, NORMALIZATION_OFFSET
+from mtcnn.result import to_arrays
 
 __author__ = "Iván de Paz Centeno"
 
+# Above this ratio between the area of the region covered by the boxes and the area of the boxes, the boxes are cropped
+# one by one instead of normalizing the whole region at once
+MAX_CANVAS_AREA_RATIO = 4
+
+
+def read_image(file_name: str):
+    """
+    Reads an image from disk as RGB, as expected by MTCNN.
+    :param file_name: path of the image
+    :return: the RGB image, or None if it could not be read.
+    """
+    image = cv2.imread(file_name)
+
+    if image is None:
+        return None
+
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image)
+
 
 class StageStatus(object):
     """
@@ -64,27 +90,91 @@ class MTCNN(object):
         b) Detection of keypoints (left eye, right eye, nose, mouth_left, mouth_right)
     """
 
+    BACKENDS = ["tensorflow", "numpy", "int8", "tf1"]
+    STAGES = ["stage1", "stage2", "stage3"]
+
     def __init__(self, weights_file: str = None, min_face_size: int = 20, steps_threshold: list = None,
-                 scale_factor: float = 0.709):
+                 scale_factor: float = 0.709, pack_pyramid: bool = False, nms_backend: str = "numpy",
+                 compile_networks: bool = True, backend: str = "tensorflow", profiler: Profiler = None,
+                 steps_max_candidates: list = None):
         """
         Initializes the MTCNN.
-        :param weights_file: file uri with the weights of the P, R and O networks from MTCNN. By default it will load
-        the ones bundled with the package.
+        :param weights_file: file uri with the weights of the P, R and O networks from MTCNN, either in the flat format of
+        mtcnn.network.weights (memory-mapped) or as a pickled .npy dict. By default it will load the ones bundled with
+        the package. For the 'int8' backend, the file with the quantized networks instead, which is not bundled and
+        must be given (see mtcnn.network.quantization to create it).
         :param min_face_size: minimum size of the face to detect
         :param steps_threshold: step's thresholds values
         :param scale_factor: scale factor
+        :param pack_pyramid: if True, all the scales of the first stage are packed in a single canvas and the P network
+        is fed only once per image, instead of once per scale.
+        :param nms_backend: implementation of the Non Maximum Suppression to use ('numpy', 'grid' or, if numba is
+        installed, 'numba'). See mtcnn.nms for details.
+        :param compile_networks: if True, the networks are run through tf.function concrete functions compiled and
+        warmed up at construction, instead of through Model.predict(). See mtcnn.network.compiled for details. Only
+        applies to the 'tensorflow' backend.
+        :param backend: implementation of the networks to use: 'tensorflow' (Keras models), 'numpy' (NumPy
+        implementation, see mtcnn.network.numpy_network), 'int8' (quantized TensorFlow Lite models, see
+        mtcnn.network.quantization) or 'tf1' (frozen TF1 graph run by a single session, see mtcnn.network.tf1).
+        TensorFlow is not imported by the 'numpy' backend.
+        :param profiler: profiler recording the timings, candidate counts and batch sizes of the detections. See
+        mtcnn.profiling for details. It can also be attached later with the profiler property or profile().
+        :param steps_max_candidates: maximum number of candidates kept after the first and the second steps (the ones
+        with the highest scores), bounding the work of the next steps on pathological images. None (or None for a
+        step) keeps all of them.
         """
         if steps_threshold is None:
             steps_threshold = [0.6, 0.7, 0.7]
 
+        if steps_max_candidates is None:
+            steps_max_candidates = [None, None]
+
+        if nms_backend not in NMS_BACKENDS:
+            raise ValueError("NMS backend {} not available. Available backends: {}".format(nms_backend,
+                                                                                          list(NMS_BACKENDS)))
+
+        if backend not in self.BACKENDS:
+            raise ValueError("Backend {} not available. Available backends: {}".format(backend, self.BACKENDS))
+
+        if weights_file is None and backend == "int8":
+            raise ValueError("The int8 backend requires the weights_file of the quantized networks, created with "
+                             "mtcnn.network.quantization.")
+
         if weights_file is None:
-            weights_file = pkg_resources.resource_stream('mtcnn', 'data/mtcnn_weights.npy')
+            weights_file = pkg_resources.resource_filename('mtcnn', 'data/mtcnn_weights.bin')
 
         self._min_face_size = min_face_size
         self._steps_threshold = steps_threshold
+        self._steps_max_candidates = steps_max_candidates
         self._scale_factor = scale_factor
+        self._pack_pyramid = pack_pyramid
+        self._nms_backend = nms_backend
+        self._profiler = profiler
+
+        self._pyramid = ImagePyramid()
+
+        if backend == "numpy":
+            from mtcnn.network.numpy_network import NumpyNetworkFactory
+            self._pnet, self._rnet, self._onet = NumpyNetworkFactory().build_P_R_O_nets_from_file(weights_file)
+
+        elif backend == "tf1":
+            from mtcnn.network.tf1 import FrozenNetworkFactory
+            self._pnet, self._rnet, self._onet = FrozenNetworkFactory().build_P_R_O_nets_from_file(weights_file)
 
-        self._pnet, self._rnet, self._onet = NetworkFactory().build_P_R_O_nets_from_file(weights_file)
+        elif backend == "int8":
+            from mtcnn.network.quantization import QuantizedNetworkFactory
+            self._pnet, self._rnet, self._onet = QuantizedNetworkFactory().build_P_R_O_nets_from_file(weights_file)
+
+        else:
+            from mtcnn.network.factory import NetworkFactory
+            self._pnet, self._rnet, self._onet = NetworkFactory().build_P_R_O_nets_from_file(weights_file)
+
+            if compile_networks:
+                from mtcnn.network.compiled import CompiledNetwork
+
+                self._pnet = CompiledNetwork(self._pnet, (None, None, 3))
+                self._rnet = CompiledNetwork(self._rnet, (24, 24, 3), batch_buckets=[16, 64, 256])
+                self._onet = CompiledNetwork(self._onet, (48, 48, 3), batch_buckets=[16, 64, 256])
 
     @property
     def min_face_size(self):
@@ -97,6 +187,49 @@ class MTCNN(object):
         except ValueError:
             self._min_face_size = 20
 
+    @property
+    def profiler(self):
+        return self._profiler
+
+    @profiler.setter
+    def profiler(self, profiler: Profiler):
+        self._profiler = profiler
+
+    @contextmanager
+    def profile(self, profiler: Profiler = None):
+        """
+        Attaches a profiler to the detector for the duration of a block.
+        :param profiler: profiler to attach. By default, a new one.
+        :return: context manager yielding the attached profiler.
+        """
+        previous = self._profiler
+        self._profiler = profiler if profiler is not None else Profiler()
+
+        try:
+            yield self._profiler
+        finally:
+            self._profiler = previous
+
+    def __timed(self, operation: str):
+        return NULL_CONTEXT if self._profiler is None else self._profiler.time(operation)
+
+    def __observe(self, metric: str, label: str, value):
+        if self._profiler is not None:
+            self._profiler.observe(metric, label, value)
+
+    def __predict(self, name: str, network, x) -> list:
+        """
+        Feeds a network, recording the batch size and the time spent.
+        """
+        self.__observe("batch_size", name, x.shape[0])
+
+        with self.__timed(name):
+            return network.predict(x)
+
+    def __nms(self, boxes, threshold: float, method: str):
+        with self.__timed("nms"):
+            return nms(boxes, threshold, method, backend=self._nms_backend)
+
     def __compute_scale_pyramid(self, m, min_layer):
         scales = []
         factor_count = 0
@@ -108,26 +241,6 @@ class MTCNN(object):
 
         return scales
 
-    @staticmethod
-    def __scale_image(image, scale: float):
-        """
-        Scales the image to a given scale.
-        :param image:
-        :param scale:
-        :return:
-        """
-        height, width, _ = image.shape
-
-        width_scaled = int(np.ceil(width * scale))
-        height_scaled = int(np.ceil(height * scale))
-
-        im_data = cv2.resize(image, (width_scaled, height_scaled), interpolation=cv2.INTER_AREA)
-
-        # Normalize the image's pixels
-        im_data_normalized = (im_data - 127.5) * 0.0078125
-
-        return im_data_normalized
-
     @staticmethod
     def __generate_bounding_box(imap, reg, scale, t):
 
@@ -163,57 +276,6 @@ class MTCNN(object):
 
         return boundingbox, reg
 
-    @staticmethod
-    def __nms(boxes, threshold, method):
-        """
-        Non Maximum Suppression.
-
-        :param boxes: np array with bounding boxes.
-        :param threshold:
-        :param method: NMS method to apply. Available values ('Min', 'Union')
-        :return:
-        """
-        if boxes.size == 0:
-            return np.empty((0, 3))
-
-        x1 = boxes[:, 0]
-        y1 = boxes[:, 1]
-        x2 = boxes[:, 2]
-        y2 = boxes[:, 3]
-        s = boxes[:, 4]
-
-        area = (x2 - x1 + 1) * (y2 - y1 + 1)
-        sorted_s = np.argsort(s)
-
-        pick = np.zeros_like(s, dtype=np.int16)
-        counter = 0
-        while sorted_s.size > 0:
-            i = sorted_s[-1]
-            pick[counter] = i
-            counter += 1
-            idx = sorted_s[0:-1]
-
-            xx1 = np.maximum(x1[i], x1[idx])
-            yy1 = np.maximum(y1[i], y1[idx])
-            xx2 = np.minimum(x2[i], x2[idx])
-            yy2 = np.minimum(y2[i], y2[idx])
-
-            w = np.maximum(0.0, xx2 - xx1 + 1)
-            h = np.maximum(0.0, yy2 - yy1 + 1)
-
-            inter = w * h
-
-            if method is 'Min':
-                o = inter / np.minimum(area[i], area[idx])
-            else:
-                o = inter / (area[i] + area[idx] - inter)
-
-            sorted_s = sorted_s[np.where(o <= threshold)]
-
-        pick = pick[0:counter]
-
-        return pick
-
     @staticmethod
     def __pad(total_boxes, w, h):
         # compute the padding coordinates (pad the bounding boxes to square)
@@ -249,6 +311,19 @@ class MTCNN(object):
 
         return dy, edy, dx, edx, y, ey, x, ex, tmpw, tmph
 
+    @staticmethod
+    def __top_candidates(total_boxes, max_candidates: int):
+        """
+        Keeps the candidates with the highest scores.
+        :param total_boxes: candidate boxes, with the score in the fifth column
+        :param max_candidates: maximum number of candidates to keep, or None to keep all of them
+        :return: the selected candidates, sorted by decreasing score if any was discarded
+        """
+        if max_candidates is None or total_boxes.shape[0] <= max_candidates:
+            return total_boxes
+
+        return total_boxes[np.argsort(-total_boxes[:, 4], kind="stable")[0:max_candidates], :]
+
     @staticmethod
     def __rerec(bbox):
         # convert bbox to square
@@ -275,32 +350,34 @@ class MTCNN(object):
         boundingbox[:, 0:4] = np.transpose(np.vstack([b1, b2, b3, b4]))
         return boundingbox
 
-    def detect_faces(self, img) -> list:
+    def __compute_scales(self, height, width, max_face_size=None):
         """
-        Detects bounding boxes from the specified image.
-        :param img: image to process
-        :return: list containing all the bounding boxes detected with their keypoints.
+        Computes the scale pyramid for an image of the given dimensions.
+        :param height: height of the image
+        :param width: width of the image
+        :param max_face_size: if given, the scales at which the faces found are larger than this size are skipped.
+        :return: list of scales to apply on the first stage
         """
-        if img is None or not hasattr(img, "shape"):
-            raise InvalidImage("Image not valid.")
-
-        height, width, _ = img.shape
-        stage_status = StageStatus(width=width, height=height)
-
         m = 12 / self._min_face_size
         min_layer = np.amin([height, width]) * m
 
         scales = self.__compute_scale_pyramid(m, min_layer)
 
-        stages = [self.__stage1, self.__stage2, self.__stage3]
-        result = [scales, stage_status]
-
-        # We pipe here each of the stages
-        for stage in stages:
-            result = stage(img, result[0], result[1])
+        if max_face_size is not None:
+            # A face of size S is found around the scale 12 / S; one more level is kept as a margin
+            min_scale = 12 / max_face_size * self._scale_factor
+            scales = [scale for scale in scales if scale >= min_scale]
 
-        [total_boxes, points] = result
+        return scales
 
+    @staticmethod
+    def __to_faces(total_boxes, points) -> list:
+        """
+        Converts the output of the last stage into the list of faces returned to the user.
+        :param total_boxes: bounding boxes obtained from the third stage.
+        :param points: keypoints obtained from the third stage.
+        :return: list containing all the bounding boxes with their keypoints.
+        """
         bounding_boxes = []
 
         for bounding_box, keypoints in zip(total_boxes, points.T):
@@ -322,6 +399,403 @@ class MTCNN(object):
 
         return bounding_boxes
 
+    @staticmethod
+    def __crop_roi(img, roi):
+        """
+        Crops the region of interest of an image, clipped to the image bounds.
+        :param img: image to crop
+        :param roi: region of interest, as [x, y, width, height]
+        :return: tuple (view of the region in the image, (x, y) offset of the region)
+        """
+        height, width = img.shape[0:2]
+        x, y, roi_width, roi_height = [int(value) for value in roi]
+
+        if roi_width < 0 or roi_height < 0:
+            raise ValueError("The region of interest must have a positive width and height.")
+
+        x1, y1 = min(max(x, 0), width), min(max(y, 0), height)
+        x2, y2 = min(max(x + roi_width, 0), width), min(max(y + roi_height, 0), height)
+
+        return img[y1:y2, x1:x2], (x1, y1)
+
+    @staticmethod
+    def __to_full_frame(total_boxes, points, offset):
+        """
+        Translates the output of the last stage from the coordinates of a region of interest to the ones of the image.
+        :param total_boxes: bounding boxes obtained from the third stage.
+        :param points: keypoints obtained from the third stage.
+        :param offset: (x, y) offset of the region of interest in the image
+        """
+        if total_boxes.shape[0] == 0:
+            return
+
+        x, y = offset
+        total_boxes[:, [0, 2]] += x
+        total_boxes[:, [1, 3]] += y
+        points[0:5, :] += x
+        points[5:10, :] += y
+
+    def detect_faces(self, img, as_array: bool = False, roi=None, max_face_size=None):
+        """
+        Detects bounding boxes from the specified image.
+        :param img: image to process
+        :param as_array: if True, the faces are returned as a tuple of arrays instead of a list of dicts. See
+        mtcnn.result.to_arrays() for the format, and mtcnn.result.FaceList to view them as a list of dicts.
+        :param roi: if given, region of the image to look for faces in, as [x, y, width, height]. The coordinates of the
+        faces found are still relative to the whole image.
+        :param max_face_size: if given, maximum size in pixels of the faces to look for. The levels of the pyramid that
+        would only find bigger faces are skipped.
+        :return: list containing all the bounding boxes detected with their keypoints.
+        """
+        if img is None or not hasattr(img, "shape"):
+            raise InvalidImage("Image not valid.")
+
+        offset = None
+
+        if roi is not None:
+            img, offset = self.__crop_roi(img, roi)
+
+        height, width, _ = img.shape
+        stage_status = StageStatus(width=width, height=height)
+
+        with self.__timed("detect_faces"):
+            scales = self.__compute_scales(height, width, max_face_size)
+
+            stages = [self.__stage1, self.__stage2, self.__stage3]
+            result = [scales, stage_status]
+
+            # We pipe here each of the stages
+            for stage, name in zip(stages, self.STAGES):
+                result = stage(img, result[0], result[1])
+                self.__observe("boxes", name, result[0].shape[0])
+
+                # Early exit: there is no candidate left for the next stages
+                if result[0].shape[0] == 0:
+                    result = [np.empty(shape=(0,)), np.empty(shape=(0,))]
+                    break
+
+            [total_boxes, points] = result
+
+            if offset is not None:
+                self.__to_full_frame(total_boxes, points, offset)
+
+            with self.__timed("result"):
+                if as_array:
+                    return to_arrays(total_boxes, points)
+
+                return self.__to_faces(total_boxes, points)
+
+    def _refine_faces(self, img, boxes) -> list:
+        """
+        Detects faces running only the second and third stages, seeded with the given candidate boxes instead of the
+        output of the first stage (for example, the faces found in the previous frame of a video).
+        :param img: image to process
+        :param boxes: array of shape (N, 4) with the candidate boxes, as [x1, y1, x2, y2]
+        :return: list containing all the bounding boxes detected with their keypoints.
+        """
+        if img is None or not hasattr(img, "shape"):
+            raise InvalidImage("Image not valid.")
+
+        height, width, _ = img.shape
+        stage_status = StageStatus(width=width, height=height)
+
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+
+        if boxes.shape[0] == 0:
+            return []
+
+        total_boxes = self.__rerec(np.hstack([boxes, np.ones((boxes.shape[0], 1))]))
+        total_boxes[:, 0:4] = np.fix(total_boxes[:, 0:4])
+        stage_status = StageStatus(self.__pad(total_boxes.copy(), width, height), width=width, height=height)
+
+        total_boxes, stage_status = self.__stage2(img, total_boxes, stage_status)
+        total_boxes, points = self.__stage3(img, total_boxes, stage_status)
+
+        return self.__to_faces(total_boxes, points)
+
+    def detect_faces_batch(self, images, as_array: bool = False) -> list:
+        """
+        Detects bounding boxes from several images at once.
+
+        The first stage is run per image, but the candidates of every image are pooled so that the second and the third
+        stages feed the R and O networks only once for the whole batch.
+        :param images: iterable of images to process
+        :param as_array: if True, the faces of each image are returned as a tuple of arrays, as in detect_faces().
+        :return: list with, for each image, the list of bounding boxes detected with their keypoints.
+        """
+        images = list(images)
+
+        for img in images:
+            if img is None or not hasattr(img, "shape"):
+                raise InvalidImage("Image not valid.")
+
+        with self.__timed("detect_faces_batch"):
+            return self.__detect_faces_batch(images, as_array)
+
+    def detect_files(self, file_names, workers: int = 4, prefetch: int = None, **kwargs):
+        """
+        Detects the faces of several image files, overlapping the reading of the next files with the detection.
+
+        The files are read and converted to RGB by a pool of threads (OpenCV releases the GIL while decoding), keeping
+        at most a bounded number of decoded images in memory, while the detection runs in the calling thread.
+        :param file_names: iterable of paths of the images to process
+        :param workers: number of threads reading the images
+        :param prefetch: maximum number of images read ahead of the detection. By default, twice the number of workers.
+        :param kwargs: other arguments of detect_faces() (as_array, roi, max_face_size)
+        :return: generator yielding, for each file and in the same order, the faces returned by detect_faces().
+        """
+        if prefetch is None:
+            prefetch = 2 * workers
+
+        file_names = iter(file_names)
+        executor = ThreadPoolExecutor(max_workers=workers)
+        pending = deque()
+
+        try:
+            for file_name in islice(file_names, max(prefetch, 1)):
+                pending.append((file_name, executor.submit(read_image, file_name)))
+
+            while len(pending) > 0:
+                file_name, future = pending.popleft()
+
+                for next_file_name in islice(file_names, 1):
+                    pending.append((next_file_name, executor.submit(read_image, next_file_name)))
+
+                image = future.result()
+
+                if image is None:
+                    raise InvalidImage("Image {} not valid.".format(file_name))
+
+                yield self.detect_faces(image, **kwargs)
+
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+            executor.shutdown(wait=False)
+
+    def __detect_faces_batch(self, images: list, as_array: bool) -> list:
+        results = []
+
+        for img in images:
+            height, width, _ = img.shape
+            scales = self.__compute_scales(height, width)
+            results.append(self.__stage1(img, scales, StageStatus(width=width, height=height)))
+            self.__observe("boxes", "stage1", results[-1][0].shape[0])
+
+        # Second stage, pooling the 24x24 crops of all the images
+        with self.__timed("stage2_crops"):
+            patches = [self.__extract_patches(img, total_boxes, status, 24)
+                       for img, (total_boxes, status) in zip(images, results)]
+
+        outs = self.__predict_pooled("rnet", self._rnet, patches)
+
+        for i, ((total_boxes, status), patch, out) in enumerate(zip(results, patches, outs)):
+            if total_boxes.shape[0] > 0:
+                if patch is None:
+                    results[i] = np.empty(shape=(0,)), status
+                else:
+                    results[i] = self.__filter_stage2(total_boxes, out), status
+
+            self.__observe("boxes", "stage2", results[i][0].shape[0])
+
+        # Third stage, pooling the 48x48 crops of all the images
+        prepared = [self.__prepare_stage3(total_boxes, status) for total_boxes, status in results]
+
+        with self.__timed("stage3_crops"):
+            patches = [self.__extract_patches(img, total_boxes, status, 48)
+                       for img, (total_boxes, status) in zip(images, prepared)]
+
+        outs = self.__predict_pooled("onet", self._onet, patches)
+
+        faces = []
+        to_faces = to_arrays if as_array else self.__to_faces
+
+        for (total_boxes, status), patch, out in zip(prepared, patches, outs):
+            if total_boxes.shape[0] == 0 or patch is None:
+                total_boxes, points = np.empty(shape=(0,)), np.empty(shape=(0,))
+            else:
+                total_boxes, points = self.__filter_stage3(total_boxes, out)
+
+            self.__observe("boxes", "stage3", total_boxes.shape[0])
+
+            with self.__timed("result"):
+                faces.append(to_faces(total_boxes, points))
+
+        return faces
+
+    @staticmethod
+    def __extract_patches(img, total_boxes, stage_status: StageStatus, size: int):
+        """
+        Crops the candidate boxes from the image and resizes them to the input size of the next network.
+
+        The region covered by all the boxes is normalized and padded once into a float32 canvas, so that every box
+        (including the parts given by the padding coordinates of the stage status that lie outside of the image) is a
+        plain view of it. Each view is then resized straight into a preallocated float32 batch. The canvas is stored
+        transposed, so that the batch is already laid out as the networks expect it.
+
+        When the boxes are scattered, so that the region is much larger than the boxes themselves, each box is
+        normalized and padded in turn into a scratch buffer instead, which bounds the work by the area of the boxes.
+        :param img: image to crop from
+        :param total_boxes: candidate boxes
+        :param stage_status: padding coordinates of the candidate boxes
+        :param size: side of the squared patches (24 for RNet, 48 for ONet)
+        :return: normalized float32 patches ready to be fed to the network, or None if a box could not be cropped.
+        """
+        num_boxes = total_boxes.shape[0]
+        patches = np.empty(shape=(num_boxes, size, size, 3), dtype=np.float32)
+
+        if num_boxes == 0:
+            return patches
+
+        tmpw = np.asarray(stage_status.tmpw, dtype=np.int64)
+        tmph = np.asarray(stage_status.tmph, dtype=np.int64)
+
+        if not np.all((tmpw > 0) & (tmph > 0) | (tmpw == 0) & (tmph == 0)):
+            return None
+
+        # Corners of each box in the image, regardless of the part that lies outside of it
+        x1 = np.asarray(stage_status.x, dtype=np.int64) - np.asarray(stage_status.dx, dtype=np.int64)
+        y1 = np.asarray(stage_status.y, dtype=np.int64) - np.asarray(stage_status.dy, dtype=np.int64)
+        x2 = x1 + tmpw
+        y2 = y1 + tmph
+
+        left, top, right, bottom = x1.min(), y1.min(), x2.max(), y2.max()
+
+        if (right - left) * (bottom - top) > MAX_CANVAS_AREA_RATIO * np.sum(tmpw * tmph):
+            scratch = np.empty(shape=(tmpw.max(), tmph.max(), 3), dtype=np.float32)
+
+            for k in range(0, num_boxes):
+                if tmpw[k] == 0:
+                    patches[k].fill(NORMALIZATION_OFFSET)
+                else:
+                    crop = MTCNN.__crop_normalized(img, x1[k], y1[k], x2[k], y2[k], scratch[:tmpw[k], :tmph[k], :])
+                    cv2.resize(crop, (size, size), dst=patches[k], interpolation=cv2.INTER_AREA)
+
+            return patches
+
+        canvas = MTCNN.__crop_normalized(img, left, top, right, bottom,
+                                         np.empty(shape=(right - left, bottom - top, 3), dtype=np.float32))
+
+        x1 -= left
+        x2 -= left
+        y1 -= top
+        y2 -= top
+
+        for k in range(0, num_boxes):
+            if tmpw[k] == 0:
+                patches[k].fill(NORMALIZATION_OFFSET)
+            else:
+                cv2.resize(canvas[x1[k]:x2[k], y1[k]:y2[k], :], (size, size), dst=patches[k],
+                           interpolation=cv2.INTER_AREA)
+
+        return patches
+
+    @staticmethod
+    def __crop_normalized(img, left: int, top: int, right: int, bottom: int, out):
+        """
+        Crops a region of the image, normalized and transposed, padding with zeros the parts outside of the image.
+        :param img: image to crop from
+        :param left: left coordinate of the region (may be negative)
+        :param top: top coordinate of the region (may be negative)
+        :param right: right coordinate of the region (may exceed the width of the image)
+        :param bottom: bottom coordinate of the region (may exceed the height of the image)
+        :param out: float32 buffer of shape (right - left, bottom - top, 3) to write the crop to
+        :return: out
+        """
+        height, width = img.shape[0:2]
+        inner_left, inner_top = max(left, 0), max(top, 0)
+        inner_right, inner_bottom = min(right, width), min(bottom, height)
+
+        if inner_left >= inner_right or inner_top >= inner_bottom:
+            out.fill(NORMALIZATION_OFFSET)
+            return out
+
+        # The outside of the image is padded with zeros, which are normalized as well
+        out[:inner_left - left].fill(NORMALIZATION_OFFSET)
+        out[inner_right - left:].fill(NORMALIZATION_OFFSET)
+        out[:, :inner_top - top].fill(NORMALIZATION_OFFSET)
+        out[:, inner_bottom - top:].fill(NORMALIZATION_OFFSET)
+
+        inner = out[inner_left - left:inner_right - left, inner_top - top:inner_bottom - top, :]
+        normalize(np.transpose(img[inner_top:inner_bottom, inner_left:inner_right, 0:3], (1, 0, 2)), inner)
+
+        return out
+
+    def __predict_pooled(self, name: str, network, patches: list) -> list:
+        """
+        Feeds the network once with the patches of several images and splits back the outputs per image.
+        :param name: name of the network, for the profiler
+        :param network: network to feed
+        :param patches: list with the patches of each image (None or empty when there is nothing to feed)
+        :return: list with the outputs of the network for each image (None when nothing was fed)
+        """
+        batch = [patch for patch in patches if patch is not None and patch.shape[0] > 0]
+
+        if len(batch) == 0:
+            return [None] * len(patches)
+
+        out = self.__predict(name, network, np.concatenate(batch, axis=0))
+
+        outs = []
+        offset = 0
+
+        for patch in patches:
+            if patch is None or patch.shape[0] == 0:
+                outs.append(None)
+                continue
+
+            outs.append([o[offset:offset + patch.shape[0]] for o in out])
+            offset += patch.shape[0]
+
+        return outs
+
+    @staticmethod
+    def __pnet_output_size(size: int) -> int:
+        """
+        Computes the size of the heatmap that the P network outputs for an input of the given size.
+        :param size: height or width of the input
+        :return: height or width of the heatmap
+        """
+        return (size - 1) // 2 - 4
+
+    def __feed_pnet(self, scaled_image):
+        """
+        Feeds the P network with a single level of the pyramid.
+        :param scaled_image: normalized level of the pyramid
+        :return: tuple (regression, heatmap) for the level
+        """
+        img_x = np.expand_dims(scaled_image, 0)
+        img_y = np.transpose(img_x, (0, 2, 1, 3))
+
+        out = self.__predict("pnet", self._pnet, img_y)
+
+        out0 = np.transpose(out[0], (0, 2, 1, 3))
+        out1 = np.transpose(out[1], (0, 2, 1, 3))
+
+        return out0[0, :, :, :], out1[0, :, :, 1]
+
+    def __feed_pnet_packed(self, levels: list) -> list:
+        """
+        Feeds the P network once with all the levels of the pyramid packed in a single canvas, and maps the heatmap
+        back to each level.
+        :param levels: normalized levels of the pyramid
+        :return: list of tuples (regression, heatmap) for each level
+        """
+        canvas, offsets = self._pyramid.pack(levels)
+        reg, heatmap = self.__feed_pnet(canvas)
+
+        outputs = []
+
+        for (y, x), level in zip(offsets, levels):
+            # The P network has a stride of 2, and the levels are placed at even offsets
+            y, x = y // 2, x // 2
+            height = self.__pnet_output_size(level.shape[0])
+            width = self.__pnet_output_size(level.shape[1])
+            outputs.append((reg[y:y + height, x:x + width, :], heatmap[y:y + height, x:x + width]))
+
+        return outputs
+
     def __stage1(self, image, scales: list, stage_status: StageStatus):
         """
         First stage of the MTCNN.
@@ -333,22 +807,23 @@ class MTCNN(object):
         total_boxes = np.empty((0, 9))
         status = stage_status
 
-        for scale in scales:
-            scaled_image = self.__scale_image(image, scale)
-
-            img_x = np.expand_dims(scaled_image, 0)
-            img_y = np.transpose(img_x, (0, 2, 1, 3))
+        with self.__timed("pyramid"):
+            levels = self._pyramid.build(image, scales)
 
-            out = self._pnet.predict(img_y)
+        if self._pack_pyramid and len(levels) > 1:
+            outputs = self.__feed_pnet_packed(levels)
+        else:
+            outputs = [self.__feed_pnet(level) for level in levels]
 
-            out0 = np.transpose(out[0], (0, 2, 1, 3))
-            out1 = np.transpose(out[1], (0, 2, 1, 3))
+        for scale, (reg, heatmap) in zip(scales, outputs):
+            if heatmap.size == 0 or heatmap.max() < self._steps_threshold[0]:
+                continue
 
-            boxes, _ = self.__generate_bounding_box(out1[0, :, :, 1].copy(),
-                                                    out0[0, :, :, :].copy(), scale, self._steps_threshold[0])
+            with self.__timed("generate_boxes"):
+                boxes, _ = self.__generate_bounding_box(heatmap.copy(), reg.copy(), scale, self._steps_threshold[0])
 
             # inter-scale nms
-            pick = self.__nms(boxes.copy(), 0.5, 'Union')
+            pick = self.__nms(boxes, 0.5, 'Union')
             if boxes.size > 0 and pick.size > 0:
                 boxes = boxes[pick, :]
                 total_boxes = np.append(total_boxes, boxes, axis=0)
@@ -356,8 +831,8 @@ class MTCNN(object):
         numboxes = total_boxes.shape[0]
 
         if numboxes > 0:
-            pick = self.__nms(total_boxes.copy(), 0.7, 'Union')
-            total_boxes = total_boxes[pick, :]
+            pick = self.__nms(total_boxes, 0.7, 'Union')
+            total_boxes = self.__top_candidates(total_boxes[pick, :], self._steps_max_candidates[0])
 
             regw = total_boxes[:, 2] - total_boxes[:, 0]
             regh = total_boxes[:, 3] - total_boxes[:, 1]
@@ -390,25 +865,23 @@ class MTCNN(object):
             return total_boxes, stage_status
 
         # second stage
-        tempimg = np.zeros(shape=(24, 24, 3, num_boxes))
-
-        for k in range(0, num_boxes):
-            tmp = np.zeros((int(stage_status.tmph[k]), int(stage_status.tmpw[k]), 3))
+        with self.__timed("stage2_crops"):
+            tempimg1 = self.__extract_patches(img, total_boxes, stage_status, 24)
 
-            tmp[stage_status.dy[k] - 1:stage_status.edy[k], stage_status.dx[k] - 1:stage_status.edx[k], :] = \
-                img[stage_status.y[k] - 1:stage_status.ey[k], stage_status.x[k] - 1:stage_status.ex[k], :]
+        if tempimg1 is None:
+            return np.empty(shape=(0,)), stage_status
 
-            if tmp.shape[0] > 0 and tmp.shape[1] > 0 or tmp.shape[0] == 0 and tmp.shape[1] == 0:
-                tempimg[:, :, :, k] = cv2.resize(tmp, (24, 24), interpolation=cv2.INTER_AREA)
+        out = self.__predict("rnet", self._rnet, tempimg1)
 
-            else:
-                return np.empty(shape=(0,)), stage_status
-
-        tempimg = (tempimg - 127.5) * 0.0078125
-        tempimg1 = np.transpose(tempimg, (3, 1, 0, 2))
-
-        out = self._rnet.predict(tempimg1)
+        return self.__filter_stage2(total_boxes, out), stage_status
 
+    def __filter_stage2(self, total_boxes, out):
+        """
+        Filters and calibrates the candidate boxes with the output of the R network.
+        :param total_boxes: candidate boxes fed to the R network
+        :param out: output of the R network for these boxes
+        :return: refined boxes
+        """
         out0 = np.transpose(out[0])
         out1 = np.transpose(out[1])
 
@@ -425,8 +898,26 @@ class MTCNN(object):
             total_boxes = total_boxes[pick, :]
             total_boxes = self.__bbreg(total_boxes.copy(), np.transpose(mv[:, pick]))
             total_boxes = self.__rerec(total_boxes.copy())
+            total_boxes = self.__top_candidates(total_boxes, self._steps_max_candidates[1])
+
+        return total_boxes
+
+    def __prepare_stage3(self, total_boxes, stage_status: StageStatus):
+        """
+        Computes the padding coordinates of the boxes that are going to be fed to the O network.
+        :param total_boxes: boxes obtained from the second stage
+        :param stage_status: status of the previous stage
+        :return: tuple (boxes, status) for the third stage
+        """
+        if total_boxes.shape[0] == 0:
+            return total_boxes, stage_status
+
+        total_boxes = np.fix(total_boxes).astype(np.int32)
+
+        status = StageStatus(self.__pad(total_boxes.copy(), stage_status.width, stage_status.height),
+                             width=stage_status.width, height=stage_status.height)
 
-        return total_boxes, stage_status
+        return total_boxes, status
 
     def __stage3(self, img, total_boxes, stage_status: StageStatus):
         """
@@ -441,29 +932,25 @@ class MTCNN(object):
         if num_boxes == 0:
             return total_boxes, np.empty(shape=(0,))
 
-        total_boxes = np.fix(total_boxes).astype(np.int32)
+        total_boxes, status = self.__prepare_stage3(total_boxes, stage_status)
 
-        status = StageStatus(self.__pad(total_boxes.copy(), stage_status.width, stage_status.height),
-                             width=stage_status.width, height=stage_status.height)
+        with self.__timed("stage3_crops"):
+            tempimg1 = self.__extract_patches(img, total_boxes, status, 48)
 
-        tempimg = np.zeros((48, 48, 3, num_boxes))
+        if tempimg1 is None:
+            return np.empty(shape=(0,)), np.empty(shape=(0,))
 
-        for k in range(0, num_boxes):
-
-            tmp = np.zeros((int(status.tmph[k]), int(status.tmpw[k]), 3))
+        out = self.__predict("onet", self._onet, tempimg1)
 
-            tmp[status.dy[k] - 1:status.edy[k], status.dx[k] - 1:status.edx[k], :] = \
-                img[status.y[k] - 1:status.ey[k], status.x[k] - 1:status.ex[k], :]
-
-            if tmp.shape[0] > 0 and tmp.shape[1] > 0 or tmp.shape[0] == 0 and tmp.shape[1] == 0:
-                tempimg[:, :, :, k] = cv2.resize(tmp, (48, 48), interpolation=cv2.INTER_AREA)
-            else:
-                return np.empty(shape=(0,)), np.empty(shape=(0,))
+        return self.__filter_stage3(total_boxes, out)
 
-        tempimg = (tempimg - 127.5) * 0.0078125
-        tempimg1 = np.transpose(tempimg, (3, 1, 0, 2))
-
-        out = self._onet.predict(tempimg1)
+    def __filter_stage3(self, total_boxes, out):
+        """
+        Filters and calibrates the candidate boxes with the output of the O network, computing their keypoints.
+        :param total_boxes: candidate boxes fed to the O network
+        :param out: output of the O network for these boxes
+        :return: tuple (boxes, keypoints)
+        """
         out0 = np.transpose(out[0])
         out1 = np.transpose(out[1])
         out2 = np.transpose(out[2])
@@ -488,7 +975,7 @@ class MTCNN(object):
 
         if total_boxes.shape[0] > 0:
             total_boxes = self.__bbreg(total_boxes.copy(), np.transpose(mv))
-            pick = self.__nms(total_boxes.copy(), 0.7, 'Min')
+            pick = self.__nms(total_boxes, 0.7, 'Min')
             total_boxes = total_boxes[pick, :]
             points = points[:, pick]
 
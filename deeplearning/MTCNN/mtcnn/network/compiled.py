@@ -0,0 +1,96 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2019 Iván de Paz Centeno
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import numpy as np
+import tensorflow as tf
+
+
+class CompiledNetwork:
+    """
+    Runs a Keras model through tf.function concrete functions with fixed input signatures, avoiding the data pipeline
+    that Model.predict() builds on every call and the retracing for every new input shape.
+
+    Networks with a fixed input size (R and O networks) are compiled for a few batch sizes (buckets): the batches are
+    split and padded to fit them. Networks with a variable input size (P network) are compiled once with a signature
+    that leaves the spatial dimensions undefined, so that every image size shares the same graph. Padding their inputs
+    to a few size buckets instead would alter the outputs on the borders, as the max-pooling of the P network takes
+    into account the padded pixels on odd sizes.
+    """
+
+    WARMUP_SIZE = 48
+
+    def __init__(self, model, input_shape: tuple, batch_buckets: list = None):
+        """
+        Initializes the compiled network, tracing and running once all of its concrete functions.
+        :param model: Keras model to compile.
+        :param input_shape: shape of a single input (without the batch dimension). Dimensions set to None are left
+        undefined in the signature.
+        :param batch_buckets: batch sizes to compile the network for. If None, the batch dimension is left undefined.
+        """
+        self._model = model
+        self.__batch_buckets = sorted(batch_buckets) if batch_buckets else None
+
+        function = tf.function(self.__call, autograph=False)
+        self.__concrete_functions = {
+            bucket: function.get_concrete_function(tf.TensorSpec((bucket,) + tuple(input_shape), tf.float32))
+            for bucket in self.__batch_buckets or [None]
+        }
+
+        warmup_shape = tuple(self.WARMUP_SIZE if size is None else size for size in input_shape)
+
+        for bucket in self.__batch_buckets or [1]:
+            self.predict(np.zeros((bucket,) + warmup_shape, dtype=np.float32))
+
+    def __call(self, x):
+        return self._model(x, training=False)
+
+    def __run(self, x, bucket=None) -> list:
+        return [output.numpy() for output in self.__concrete_functions[bucket](tf.constant(x))]
+
+    def predict(self, x) -> list:
+        """
+        Feeds the network.
+        :param x: batch of inputs.
+        :return: list with the outputs of the network, as returned by Model.predict().
+        """
+        x = np.asarray(x, dtype=np.float32)
+
+        if self.__batch_buckets is None:
+            return self.__run(x)
+
+        max_bucket = self.__batch_buckets[-1]
+        chunks = []
+
+        for start in range(0, max(x.shape[0], 1), max_bucket):
+            chunk = x[start:start + max_bucket]
+            count = chunk.shape[0]
+            bucket = next(bucket for bucket in self.__batch_buckets if bucket >= count)
+
+            if bucket > count:
+                chunk = np.concatenate([chunk, np.zeros((bucket - count,) + chunk.shape[1:], dtype=np.float32)])
+
+            chunks.append([output[0:count] for output in self.__run(chunk, bucket)])
+
+        return [np.concatenate(outputs, axis=0) for outputs in zip(*chunks)]
@@ -26,7 +26,7 @@
 from tensorflow.keras.layers import Input, Dense, Conv2D, MaxPooling2D, PReLU, Flatten, Softmax
 from tensorflow.keras.models import Model
 
-import numpy as np
+from mtcnn.network.weights import load_weights
 
 
 class NetworkFactory:
@@ -118,7 +118,7 @@ class NetworkFactory:
         return o_net
 
     def build_P_R_O_nets_from_file(self, weights_file):
-        weights = np.load(weights_file, allow_pickle=True).tolist()
+        weights = load_weights(weights_file)
 
         p_net = self.build_pnet()
         r_net = self.build_rnet()
@@ -0,0 +1,173 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2019 Iván de Paz Centeno
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from mtcnn.network.weights import load_weights
+
+
+def conv2d(x, kernel, bias):
+    """
+    Valid convolution with stride 1, computed as a GEMM over the im2col matrix of the input.
+    :param x: input of shape (N, H, W, C_in).
+    :param kernel: kernel of shape (KH, KW, C_in, C_out), as stored by Keras.
+    :param bias: bias of shape (C_out,).
+    :return: output of shape (N, H - KH + 1, W - KW + 1, C_out).
+    """
+    kernel_height, kernel_width, channels_in, channels_out = kernel.shape
+
+    if kernel_height == kernel_width == 1:
+        return x @ kernel[0, 0] + bias
+
+    # (N, H', W', C_in, KH, KW) -> (N, H', W', KH, KW, C_in), matching the layout of the Keras kernels
+    windows = sliding_window_view(x, (kernel_height, kernel_width), axis=(1, 2)).transpose(0, 1, 2, 4, 5, 3)
+    columns = windows.reshape(-1, kernel_height * kernel_width * channels_in)
+
+    result = columns @ kernel.reshape(-1, channels_out)
+    result += bias
+
+    return result.reshape(windows.shape[0:3] + (channels_out,))
+
+
+def prelu(x, alpha):
+    """
+    Parametric ReLU, with alpha shared across the spatial dimensions.
+    """
+    return np.where(x > 0, x, x * alpha.reshape(-1))
+
+
+def max_pool(x, size, stride, padding):
+    """
+    Max-pooling over the spatial dimensions of x, with the same output as the Keras MaxPooling2D layer.
+    :param x: input of shape (N, H, W, C).
+    :param size: size of the pooling window.
+    :param stride: stride of the pooling window.
+    :param padding: "valid" or "same".
+    """
+    height, width = x.shape[1:3]
+
+    if padding == "same":
+        out_height, out_width = -(-height // stride), -(-width // stride)
+        pad_height = max((out_height - 1) * stride + size - height, 0)
+        pad_width = max((out_width - 1) * stride + size - width, 0)
+
+        x = np.pad(x, ((0, 0), (pad_height // 2, pad_height - pad_height // 2),
+                       (pad_width // 2, pad_width - pad_width // 2), (0, 0)), constant_values=-np.inf)
+    else:
+        out_height, out_width = (height - size) // stride + 1, (width - size) // stride + 1
+
+    result = None
+
+    for i in range(size):
+        for j in range(size):
+            window = x[:, i:i + (out_height - 1) * stride + 1:stride, j:j + (out_width - 1) * stride + 1:stride]
+            result = window.copy() if result is None else np.maximum(result, window, out=result)
+
+    return result
+
+
+def dense(x, kernel, bias):
+    return x @ kernel + bias
+
+
+def softmax(x, axis):
+    e = np.exp(x - x.max(axis=axis, keepdims=True))
+    return e / e.sum(axis=axis, keepdims=True)
+
+
+class NumpyNetwork:
+    """
+    Base class of the NumPy implementations of the networks. They run the same layers as the Keras models built by
+    mtcnn.network.factory.NetworkFactory, from the same weights, without requiring TensorFlow.
+    """
+
+    def __init__(self, weights: list):
+        """
+        :param weights: list with the weights of the network, in the order returned by the Keras get_weights().
+        """
+        self._weights = [np.asarray(weight, dtype=np.float32) for weight in weights]
+
+    def _forward(self, x, weights) -> list:
+        raise NotImplementedError
+
+    def predict(self, x) -> list:
+        """
+        Feeds the network.
+        :param x: batch of inputs.
+        :return: list with the outputs of the network, as returned by the Keras Model.predict().
+        """
+        return self._forward(np.asarray(x, dtype=np.float32), iter(self._weights))
+
+
+class PNet(NumpyNetwork):
+
+    def _forward(self, x, weights) -> list:
+        x = max_pool(prelu(conv2d(x, next(weights), next(weights)), next(weights)), 2, 2, "same")
+        x = prelu(conv2d(x, next(weights), next(weights)), next(weights))
+        x = prelu(conv2d(x, next(weights), next(weights)), next(weights))
+
+        out1 = softmax(conv2d(x, next(weights), next(weights)), axis=3)
+        out2 = conv2d(x, next(weights), next(weights))
+
+        return [out2, out1]
+
+
+class RNet(NumpyNetwork):
+
+    def _forward(self, x, weights) -> list:
+        x = max_pool(prelu(conv2d(x, next(weights), next(weights)), next(weights)), 3, 2, "same")
+        x = max_pool(prelu(conv2d(x, next(weights), next(weights)), next(weights)), 3, 2, "valid")
+        x = prelu(conv2d(x, next(weights), next(weights)), next(weights))
+        x = prelu(dense(x.reshape(x.shape[0], -1), next(weights), next(weights)), next(weights))
+
+        out1 = softmax(dense(x, next(weights), next(weights)), axis=1)
+        out2 = dense(x, next(weights), next(weights))
+
+        return [out2, out1]
+
+
+class ONet(NumpyNetwork):
+
+    def _forward(self, x, weights) -> list:
+        x = max_pool(prelu(conv2d(x, next(weights), next(weights)), next(weights)), 3, 2, "same")
+        x = max_pool(prelu(conv2d(x, next(weights), next(weights)), next(weights)), 3, 2, "valid")
+        x = max_pool(prelu(conv2d(x, next(weights), next(weights)), next(weights)), 2, 2, "same")
+        x = prelu(conv2d(x, next(weights), next(weights)), next(weights))
+        x = prelu(dense(x.reshape(x.shape[0], -1), next(weights), next(weights)), next(weights))
+
+        out1 = softmax(dense(x, next(weights), next(weights)), axis=1)
+        out2 = dense(x, next(weights), next(weights))
+        out3 = dense(x, next(weights), next(weights))
+
+        return [out2, out3, out1]
+
+
+class NumpyNetworkFactory:
+
+    def build_P_R_O_nets_from_file(self, weights_file):
+        weights = load_weights(weights_file)
+
+        return PNet(weights['pnet']), RNet(weights['rnet']), ONet(weights['onet'])
@@ -0,0 +1,319 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2019 Iván de Paz Centeno
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Post-training int8 quantization of the P, R and O networks.
+
+The networks are converted to TensorFlow Lite models with int8 weights (per channel) and int8 activations (per
+tensor). The ranges of the activations are calibrated by running the float networks on sample images, recording the
+batches that the detector feeds to each network. The quantized models are run by the TensorFlow Lite interpreter with
+its integer kernels (XNNPACK on x86 and ARM CPUs).
+
+The int8 PReLU of TensorFlow Lite is not supported by XNNPACK and falls back to a slow reference kernel, so the PReLU
+layers are rewritten before the conversion as ReLUs fused into 1x1 depthwise convolutions:
+
+    prelu(x) = relu(x) - alpha * relu(-x) = relu(dw(x, 1)) + dw(relu(dw(x, -1)), -alpha)
+
+The quantized models are stored in a .npz file (without pickles), which is not bundled and is created with:
+
+    $ python -m mtcnn.network.quantization calibration_images/ --output mtcnn_weights_int8.npz
+"""
+
+import argparse
+import os
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+import pkg_resources
+import tensorflow as tf
+from tensorflow.keras.layers import Layer, PReLU
+from tensorflow.keras.models import clone_model
+
+from mtcnn.network.factory import NetworkFactory
+
+try:
+    from ai_edge_litert.interpreter import Interpreter
+except ImportError:
+    Interpreter = tf.lite.Interpreter
+
+__author__ = "Iván de Paz Centeno"
+
+NETWORKS = ["pnet", "rnet", "onet"]
+
+# Last dimension of each output of the networks, in the order returned by the Keras models
+OUTPUT_CHANNELS = {"pnet": [4, 2], "rnet": [4, 2], "onet": [4, 10, 2]}
+
+# Size of the chunks in which the calibration batches of the R and O networks are fed to the converter
+CALIBRATION_BATCH_SIZE = 32
+
+
+class DecomposedPReLU(Layer):
+    """
+    PReLU computed with ReLUs and 1x1 depthwise convolutions, which have int8 kernels in XNNPACK.
+    """
+
+    def __init__(self, alpha, **kwargs):
+        """
+        :param alpha: weights of the PReLU, one per channel.
+        """
+        super().__init__(**kwargs)
+        self.__alpha = np.asarray(alpha, dtype=np.float32).reshape(1, 1, -1, 1)
+
+    def call(self, x):
+        rank = len(x.shape)
+
+        if rank == 2:
+            x = tf.reshape(x, (-1, 1, 1, x.shape[-1]))
+
+        def depthwise(inputs, kernel):
+            return tf.nn.depthwise_conv2d(inputs, kernel, strides=(1, 1, 1, 1), padding="VALID")
+
+        ones = np.ones_like(self.__alpha)
+        result = tf.nn.relu(depthwise(x, ones)) + depthwise(tf.nn.relu(depthwise(x, -ones)), -self.__alpha)
+
+        if rank == 2:
+            result = tf.reshape(result, (-1, result.shape[-1]))
+
+        return result
+
+
+def decompose_prelu(model):
+    """
+    Clones a Keras model replacing its PReLU layers by DecomposedPReLU layers.
+    :param model: Keras model to clone.
+    :return: the cloned model, computing the same outputs.
+    """
+    def clone_layer(layer):
+        if isinstance(layer, PReLU):
+            return DecomposedPReLU(layer.get_weights()[0])
+
+        return layer.__class__.from_config(layer.get_config())
+
+    clone = clone_model(model, clone_function=clone_layer)
+
+    for cloned_layer, layer in zip(clone.layers, model.layers):
+        if not isinstance(layer, PReLU):
+            cloned_layer.set_weights(layer.get_weights())
+
+    return clone
+
+
+class _Recorder:
+    """
+    Wraps a network, keeping a copy of every batch it is fed with.
+    """
+
+    def __init__(self, network):
+        self.network = network
+        self.batches = []
+
+    def predict(self, x) -> list:
+        self.batches.append(np.array(x, dtype=np.float32))
+        return self.network.predict(x)
+
+
+def _representative_dataset(batches: list, split: bool):
+    def generator():
+        for batch in batches:
+            for start in range(0, batch.shape[0], CALIBRATION_BATCH_SIZE if split else batch.shape[0]):
+                yield [batch[start:start + CALIBRATION_BATCH_SIZE] if split else batch]
+
+    return generator
+
+
+def quantize(images, weights_file: str = None, **mtcnn_kwargs) -> dict:
+    """
+    Quantizes the P, R and O networks, calibrating the ranges of their activations on the given images.
+    :param images: iterable of RGB images, representative of the ones to process.
+    :param weights_file: float weights of the networks. By default, the ones bundled with the package.
+    :param mtcnn_kwargs: other arguments of the MTCNN running the calibration (thresholds, minimum face size...).
+    :return: dict with the TensorFlow Lite model of each network, as bytes.
+    """
+    from mtcnn.mtcnn import MTCNN
+
+    if weights_file is None:
+        weights_file = pkg_resources.resource_filename('mtcnn', 'data/mtcnn_weights.bin')
+
+    detector = MTCNN(weights_file, **mtcnn_kwargs)
+    recorders = [_Recorder(detector._pnet), _Recorder(detector._rnet), _Recorder(detector._onet)]
+    detector._pnet, detector._rnet, detector._onet = recorders
+
+    for image in images:
+        detector.detect_faces(image)
+
+    for name, recorder in zip(NETWORKS, recorders):
+        if len(recorder.batches) == 0:
+            raise ValueError("The calibration images did not reach the {} network: at least one image with faces is "
+                             "required.".format(name))
+
+    models = {}
+
+    for name, model, recorder in zip(NETWORKS, NetworkFactory().build_P_R_O_nets_from_file(weights_file), recorders):
+        converter = tf.lite.TFLiteConverter.from_keras_model(decompose_prelu(model))
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = _representative_dataset(recorder.batches, split=name != "pnet")
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+
+        models[name] = converter.convert()
+
+    return models
+
+
+def save_quantized(models: dict, file_name: str):
+    """
+    Stores the quantized networks in a .npz file.
+    :param models: dict with the TensorFlow Lite model of each network, as returned by quantize().
+    :param file_name: path of the file to write.
+    """
+    with open(file_name, "wb") as file:
+        np.savez(file, **{name: np.frombuffer(models[name], dtype=np.uint8) for name in NETWORKS})
+
+
+def load_quantized(file_name: str) -> dict:
+    """
+    Loads the quantized networks stored by save_quantized().
+    :param file_name: path of the file to read.
+    :return: dict with the TensorFlow Lite model of each network, as bytes.
+    """
+    if not os.path.exists(file_name):
+        raise FileNotFoundError("Quantized weights {} not found. They can be created with: python -m "
+                                "mtcnn.network.quantization <calibration images directory>".format(file_name))
+
+    with np.load(file_name, allow_pickle=False) as content:
+        return {name: content[name].tobytes() for name in NETWORKS}
+
+
+class QuantizedNetwork:
+    """
+    Runs a quantized network through the TensorFlow Lite interpreter.
+
+    Allocating the tensors of an interpreter for a new input shape is expensive, so an interpreter is kept for each of
+    the latest input shapes. As in mtcnn.network.compiled.CompiledNetwork, the batches of the networks with a fixed
+    input size are split and padded to a few batch sizes (buckets), so that they share a few interpreters.
+    """
+
+    def __init__(self, model_content: bytes, output_channels: list, batch_buckets: list = None,
+                 max_cached_shapes: int = 32, num_threads: int = None):
+        """
+        :param model_content: TensorFlow Lite model.
+        :param output_channels: last dimension of each output, in the order the outputs must be returned.
+        :param batch_buckets: batch sizes the batches are split and padded to. If None, they are run as they come.
+        :param max_cached_shapes: maximum number of input shapes an interpreter is kept for.
+        :param num_threads: number of threads of the interpreters. By default, the TensorFlow Lite default.
+        """
+        self.__model_content = model_content
+        self.__output_channels = output_channels
+        self.__batch_buckets = sorted(batch_buckets) if batch_buckets else None
+        self.__max_cached_shapes = max_cached_shapes
+        self.__num_threads = num_threads
+        self.__interpreters = OrderedDict()
+
+    def __interpreter(self, shape: tuple) -> tuple:
+        """
+        Retrieves the interpreter for the given input shape, creating it if required.
+        :return: tuple (interpreter, index of the input, indexes of the outputs in the order of output_channels)
+        """
+        entry = self.__interpreters.pop(shape, None)
+
+        if entry is None:
+            interpreter = Interpreter(model_content=self.__model_content, num_threads=self.__num_threads)
+            input_index = interpreter.get_input_details()[0]['index']
+            interpreter.resize_tensor_input(input_index, shape)
+            interpreter.allocate_tensors()
+
+            outputs = {output['shape_signature'][-1]: output['index'] for output in interpreter.get_output_details()}
+            entry = interpreter, input_index, [outputs[channels] for channels in self.__output_channels]
+
+            while len(self.__interpreters) >= self.__max_cached_shapes:
+                self.__interpreters.popitem(last=False)
+
+        self.__interpreters[shape] = entry
+        return entry
+
+    def __run(self, x) -> list:
+        interpreter, input_index, output_indexes = self.__interpreter(x.shape)
+        interpreter.set_tensor(input_index, x)
+        interpreter.invoke()
+
+        return [interpreter.get_tensor(index) for index in output_indexes]
+
+    def predict(self, x) -> list:
+        """
+        Feeds the network.
+        :param x: batch of inputs.
+        :return: list with the outputs of the network, as returned by the Keras Model.predict().
+        """
+        x = np.ascontiguousarray(x, dtype=np.float32)
+
+        if self.__batch_buckets is None:
+            return self.__run(x)
+
+        max_bucket = self.__batch_buckets[-1]
+        chunks = []
+
+        for start in range(0, max(x.shape[0], 1), max_bucket):
+            chunk = x[start:start + max_bucket]
+            count = chunk.shape[0]
+            bucket = next(bucket for bucket in self.__batch_buckets if bucket >= count)
+
+            if bucket > count:
+                chunk = np.concatenate([chunk, np.zeros((bucket - count,) + chunk.shape[1:], dtype=np.float32)])
+
+            chunks.append([output[0:count] for output in self.__run(chunk)])
+
+        return [np.concatenate(outputs, axis=0) for outputs in zip(*chunks)]
+
+
+class QuantizedNetworkFactory:
+
+    def build_P_R_O_nets_from_file(self, quantized_file):
+        models = load_quantized(quantized_file)
+
+        return (QuantizedNetwork(models['pnet'], OUTPUT_CHANNELS['pnet']),
+                QuantizedNetwork(models['rnet'], OUTPUT_CHANNELS['rnet'], batch_buckets=[16, 64, 256]),
+                QuantizedNetwork(models['onet'], OUTPUT_CHANNELS['onet'], batch_buckets=[16, 64, 256]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantizes the networks of MTCNN to int8, calibrating them on the "
+                                                 "images of a directory.")
+    parser.add_argument("images", help="directory with the calibration images")
+    parser.add_argument("--weights", default=None, help="float weights to quantize (by default, the bundled ones)")
+    parser.add_argument("--output", required=True, help="path of the file to write, to be passed as weights_file")
+    args = parser.parse_args()
+
+    weights_file = args.weights or pkg_resources.resource_filename('mtcnn', 'data/mtcnn_weights.bin')
+
+    images = (cv2.imread(os.path.join(args.images, file_name)) for file_name in sorted(os.listdir(args.images)))
+    images = [cv2.cvtColor(image, cv2.COLOR_BGR2RGB) for image in images if image is not None]
+
+    save_quantized(quantize(images, weights_file), args.output)
+    print("Quantized {} networks calibrated on {} images written to {}".format(len(NETWORKS), len(images),
+                                                                             args.output))
+
+
+if __name__ == "__main__":
+    main()
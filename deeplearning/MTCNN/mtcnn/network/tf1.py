@@ -0,0 +1,300 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+#MIT License
+#
+#Copyright (c) 2018 Iván de Paz Centeno
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+"""
+TensorFlow 1 graph implementation of the P, R and O networks, for deployments pinned to the TF1 API.
+
+The three networks are built with the LayerFactory in a single graph, their weights are assigned in one session run and
+the graph is then frozen: the variables are replaced by constants and the graph is imported in a new session shared by
+the three networks. Feeding a network is then a single session run, without variables nor scopes involved.
+"""
+
+import numpy as np
+import tensorflow as tf
+
+from mtcnn.layer_factory import LayerFactory
+from mtcnn.network.weights import load_weights
+
+__author__ = "Iván de Paz Centeno"
+
+
+class Network(object):
+
+    def __init__(self, session, trainable: bool=True):
+        """
+        Initializes the network.
+        :param trainable: flag to determine if this network should be trainable or not.
+        """
+        self._session = session
+        self.__trainable = trainable
+        self.__layers = {}
+        self.__last_layer_name = None
+
+        with tf.compat.v1.variable_scope(self.__class__.__name__.lower()):
+            self._config()
+
+    def _config(self):
+        """
+        Configures the network layers.
+        It is usually done using the LayerFactory() class.
+        """
+        raise NotImplementedError("This method must be implemented by the network.")
+
+    def add_layer(self, name: str, layer_output):
+        """
+        Adds a layer to the network.
+        :param name: name of the layer to add
+        :param layer_output: output layer.
+        """
+        self.__layers[name] = layer_output
+        self.__last_layer_name = name
+
+    def get_layer(self, name: str=None):
+        """
+        Retrieves the layer by its name.
+        :param name: name of the layer to retrieve. If name is None, it will retrieve the last added layer to the
+        network.
+        :return: layer output
+        """
+        if name is None:
+            name = self.__last_layer_name
+
+        return self.__layers[name]
+
+    def is_trainable(self):
+        """
+        Getter for the trainable flag.
+        """
+        return self.__trainable
+
+    def get_variables(self) -> list:
+        """
+        Retrieves the variables of the network, in their creation order.
+        """
+        return tf.compat.v1.get_collection(tf.compat.v1.GraphKeys.GLOBAL_VARIABLES,
+                                           scope=self.__class__.__name__.lower() + "/")
+
+    def set_weights(self, weights_values: dict, ignore_missing=False):
+        """
+        Sets the weights values of the network, all of them in a single session run.
+        :param weights_values: dictionary with weights for each layer
+        """
+        network_name = self.__class__.__name__.lower()
+        assignments = []
+
+        with tf.compat.v1.variable_scope(network_name):
+            for layer_name in weights_values:
+                with tf.compat.v1.variable_scope(layer_name, reuse=True):
+                    for param_name, data in weights_values[layer_name].items():
+                        try:
+                            var = tf.compat.v1.get_variable(param_name, use_resource=False)
+                            assignments.append(var.assign(data))
+
+                        except ValueError:
+                            if not ignore_missing:
+                                raise
+
+        self._session.run(assignments)
+
+    def get_outputs(self) -> list:
+        """
+        Retrieves the output layers of the network, in the order returned by the Keras models.
+        """
+        raise NotImplementedError("This method must be implemented by the network.")
+
+    def feed(self, image):
+        """
+        Feeds the network with an image
+        :param image: image (perhaps loaded with CV2)
+        :return: network result
+        """
+        return self._session.run(self.get_outputs(), feed_dict={self.get_layer('data'): image})
+
+
+class PNet(Network):
+
+    def _config(self):
+        layer_factory = LayerFactory(self)
+
+        layer_factory.new_feed(name='data', layer_shape=(None, None, None, 3))
+        layer_factory.new_conv(name='conv1', kernel_size=(3, 3), channels_output=10, stride_size=(1, 1),
+                               padding='VALID', relu=False)
+        layer_factory.new_prelu(name='prelu1')
+        layer_factory.new_max_pool(name='pool1', kernel_size=(2, 2), stride_size=(2, 2))
+        layer_factory.new_conv(name='conv2', kernel_size=(3, 3), channels_output=16, stride_size=(1, 1),
+                               padding='VALID', relu=False)
+        layer_factory.new_prelu(name='prelu2')
+        layer_factory.new_conv(name='conv3', kernel_size=(3, 3), channels_output=32, stride_size=(1, 1),
+                               padding='VALID', relu=False)
+        layer_factory.new_prelu(name='prelu3')
+        layer_factory.new_conv(name='conv4-1', kernel_size=(1, 1), channels_output=2, stride_size=(1, 1), relu=False)
+        layer_factory.new_softmax(name='prob1', axis=3)
+
+        layer_factory.new_conv(name='conv4-2', kernel_size=(1, 1), channels_output=4, stride_size=(1, 1),
+                               input_layer_name='prelu3', relu=False)
+
+    def get_outputs(self) -> list:
+        return [self.get_layer('conv4-2'), self.get_layer('prob1')]
+
+
+class RNet(Network):
+
+    def _config(self):
+        layer_factory = LayerFactory(self)
+
+        layer_factory.new_feed(name='data', layer_shape=(None, 24, 24, 3))
+        layer_factory.new_conv(name='conv1', kernel_size=(3, 3), channels_output=28, stride_size=(1, 1),
+                               padding='VALID', relu=False)
+        layer_factory.new_prelu(name='prelu1')
+        layer_factory.new_max_pool(name='pool1', kernel_size=(3, 3), stride_size=(2, 2))
+        layer_factory.new_conv(name='conv2', kernel_size=(3, 3), channels_output=48, stride_size=(1, 1),
+                               padding='VALID', relu=False)
+        layer_factory.new_prelu(name='prelu2')
+        layer_factory.new_max_pool(name='pool2', kernel_size=(3, 3), stride_size=(2, 2), padding='VALID')
+        layer_factory.new_conv(name='conv3', kernel_size=(2, 2), channels_output=64, stride_size=(1, 1),
+                               padding='VALID', relu=False)
+        layer_factory.new_prelu(name='prelu3')
+        layer_factory.new_fully_connected(name='fc1', output_count=128, relu=False)
+        layer_factory.new_prelu(name='prelu4')
+        layer_factory.new_fully_connected(name='fc2-1', output_count=2, relu=False)
+        layer_factory.new_softmax(name='prob1', axis=1)
+
+        layer_factory.new_fully_connected(name='fc2-2', output_count=4, relu=False, input_layer_name='prelu4')
+
+    def get_outputs(self) -> list:
+        return [self.get_layer('fc2-2'), self.get_layer('prob1')]
+
+
+class ONet(Network):
+
+    def _config(self):
+        layer_factory = LayerFactory(self)
+
+        layer_factory.new_feed(name='data', layer_shape=(None, 48, 48, 3))
+        layer_factory.new_conv(name='conv1', kernel_size=(3, 3), channels_output=32, stride_size=(1, 1),
+                               padding='VALID', relu=False)
+        layer_factory.new_prelu(name='prelu1')
+        layer_factory.new_max_pool(name='pool1', kernel_size=(3, 3), stride_size=(2, 2))
+        layer_factory.new_conv(name='conv2', kernel_size=(3, 3), channels_output=64, stride_size=(1, 1),
+                               padding='VALID', relu=False)
+        layer_factory.new_prelu(name='prelu2')
+        layer_factory.new_max_pool(name='pool2', kernel_size=(3, 3), stride_size=(2, 2), padding='VALID')
+        layer_factory.new_conv(name='conv3', kernel_size=(3, 3), channels_output=64, stride_size=(1, 1),
+                               padding='VALID', relu=False)
+        layer_factory.new_prelu(name='prelu3')
+        layer_factory.new_max_pool(name='pool3', kernel_size=(2, 2), stride_size=(2, 2))
+        layer_factory.new_conv(name='conv4', kernel_size=(2, 2), channels_output=128, stride_size=(1, 1),
+                               padding='VALID', relu=False)
+        layer_factory.new_prelu(name='prelu4')
+        layer_factory.new_fully_connected(name='fc1', output_count=256, relu=False)
+        layer_factory.new_prelu(name='prelu5')
+        layer_factory.new_fully_connected(name='fc2-1', output_count=2, relu=False)
+        layer_factory.new_softmax(name='prob1', axis=1)
+
+        layer_factory.new_fully_connected(name='fc2-2', output_count=4, relu=False, input_layer_name='prelu5')
+        layer_factory.new_fully_connected(name='fc2-3', output_count=10, relu=False, input_layer_name='prelu5')
+
+    def get_outputs(self) -> list:
+        return [self.get_layer('fc2-2'), self.get_layer('fc2-3'), self.get_layer('prob1')]
+
+
+def to_weights_values(network: Network, weights: list) -> dict:
+    """
+    Maps the weights of a network, in the order of the Keras models (see mtcnn.network.weights), to the layers and the
+    parameters of the TF1 network. Both networks create their layers in the same order.
+    :param network: TF1 network
+    :param weights: list with the weights of the network
+    :return: dictionary with weights for each layer, as expected by Network.set_weights()
+    """
+    weights_values = {}
+
+    for variable, value in zip(network.get_variables(), weights):
+        _, layer_name, param_name = variable.op.name.split("/")
+        weights_values.setdefault(layer_name, {})[param_name] = np.reshape(value, variable.shape.as_list())
+
+    return weights_values
+
+
+def freeze_networks(weights: dict) -> tuple:
+    """
+    Builds the P, R and O networks in a single graph and freezes it with the given weights.
+    :param weights: dict with the weights of the "pnet", "rnet" and "onet" networks, as returned by load_weights().
+    :return: tuple (frozen GraphDef, list with the names of the input and the outputs of each network)
+    """
+    graph = tf.Graph()
+
+    with graph.as_default(), tf.compat.v1.Session(graph=graph) as session:
+        networks = [PNet(session, False), RNet(session, False), ONet(session, False)]
+
+        for network, name in zip(networks, ["pnet", "rnet", "onet"]):
+            network.set_weights(to_weights_values(network, weights[name]))
+
+        tensor_names = [(network.get_layer('data').name, [output.name for output in network.get_outputs()])
+                        for network in networks]
+        output_nodes = [output.op.name for network in networks for output in network.get_outputs()]
+
+        graph_def = tf.compat.v1.graph_util.convert_variables_to_constants(session, graph.as_graph_def(),
+                                                                          output_nodes)
+
+    return graph_def, tensor_names
+
+
+class FrozenNetwork:
+    """
+    Runs one of the networks of a frozen graph, through the session shared by all of them.
+    """
+
+    def __init__(self, session, input_name: str, output_names: list):
+        """
+        :param session: session of the frozen graph
+        :param input_name: name of the input tensor of the network in the graph
+        :param output_names: names of the output tensors of the network in the graph
+        """
+        self.__session = session
+        self.__input = session.graph.get_tensor_by_name(input_name)
+        self.__outputs = [session.graph.get_tensor_by_name(name) for name in output_names]
+
+    def predict(self, x) -> list:
+        """
+        Feeds the network.
+        :param x: batch of inputs.
+        :return: list with the outputs of the network, as returned by the Keras Model.predict().
+        """
+        return self.__session.run(self.__outputs, feed_dict={self.__input: np.asarray(x, dtype=np.float32)})
+
+
+class FrozenNetworkFactory:
+
+    def build_P_R_O_nets_from_file(self, weights_file):
+        graph_def, tensor_names = freeze_networks(load_weights(weights_file))
+
+        graph = tf.Graph()
+
+        with graph.as_default():
+            tf.compat.v1.import_graph_def(graph_def, name="")
+
+        session = tf.compat.v1.Session(graph=graph)
+
+        return tuple(FrozenNetwork(session, input_name, output_names) for input_name, output_names in tensor_names)
@@ -0,0 +1,123 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2019 Iván de Paz Centeno
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Flat, pickle-free container for the weights of the P, R and O networks.
+
+The file starts with a fixed preamble (magic bytes and the size of the header), followed by a JSON header describing
+the shape and the offset of each weight, and a contiguous blob of little-endian float32 values aligned to 64 bytes:
+
+    | MAGIC (8 bytes) | header size (uint32 LE) | JSON header | padding | float32 blob |
+
+Loading the file maps the blob read-only with np.memmap, so the weights are neither unpickled nor copied into the heap,
+and forked processes share the same physical pages. The legacy pickled dict stored in a .npy file is also accepted by
+load_weights().
+
+The bundled mtcnn_weights.npy can be converted with:
+
+    $ python -m mtcnn.network.weights mtcnn/data/mtcnn_weights.npy mtcnn/data/mtcnn_weights.bin
+"""
+
+import argparse
+import json
+import struct
+
+import numpy as np
+
+MAGIC = b"MTCNNWTS"
+ALIGNMENT = 64
+DTYPE = np.dtype("<f4")
+NETWORKS = ["pnet", "rnet", "onet"]
+
+
+def save_weights(weights: dict, file_name: str):
+    """
+    Stores the weights of the networks in the flat format.
+    :param weights: dict with the keys 'pnet', 'rnet' and 'onet', each of them a list with the weights of the network in
+    the order returned by the Keras get_weights().
+    :param file_name: path of the file to write.
+    """
+    header = {}
+    offset = 0
+
+    for network in NETWORKS:
+        header[network] = []
+
+        for weight in weights[network]:
+            header[network].append({"shape": list(np.shape(weight)), "offset": offset})
+            offset += int(np.prod(np.shape(weight)))
+
+    header_bytes = json.dumps(header).encode("utf-8")
+    preamble_size = len(MAGIC) + 4 + len(header_bytes)
+    padding = -preamble_size % ALIGNMENT
+
+    with open(file_name, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header_bytes) + padding))
+        f.write(header_bytes + b" " * padding)
+
+        for network in NETWORKS:
+            for weight in weights[network]:
+                f.write(np.ascontiguousarray(weight, dtype=DTYPE).tobytes())
+
+
+def load_weights(file) -> dict:
+    """
+    Loads the weights of the networks.
+    :param file: path of a file in the flat format, which is memory-mapped read-only, or path or file-like object of a
+    legacy .npy file with a pickled dict.
+    :return: dict with the keys 'pnet', 'rnet' and 'onet', each of them a list with the weights of the network in the
+    order expected by the Keras set_weights().
+    """
+    if hasattr(file, "read"):
+        return np.load(file, allow_pickle=True).tolist()
+
+    with open(file, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            return np.load(file, allow_pickle=True).tolist()
+
+        header_size, = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(header_size).decode("utf-8"))
+
+    blob = np.memmap(file, dtype=DTYPE, mode="r", offset=len(MAGIC) + 4 + header_size)
+
+    return {
+        network: [blob[entry["offset"]:entry["offset"] + int(np.prod(entry["shape"]))].reshape(entry["shape"])
+                  for entry in header[network]]
+        for network in NETWORKS
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Converts a pickled .npy weights file of MTCNN to the flat format.")
+    parser.add_argument("source", help="path of the .npy file to convert")
+    parser.add_argument("destination", help="path of the file to write")
+    args = parser.parse_args()
+
+    save_weights(np.load(args.source, allow_pickle=True).tolist(), args.destination)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2019 Iván de Paz Centeno
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Non Maximum Suppression.
+
+Several interchangeable backends are provided, all of them producing the same picks:
+
+ - "numpy": greedy suppression over the boxes sorted once by score.
+ - "numba": the same algorithm compiled with numba (only available when numba is installed).
+ - "grid": boxes are bucketed in a grid whose cells are as big as the biggest box, so that each box is only compared
+   against the boxes of its neighbouring cells. It pays off with many boxes of similar size, as the boxes generated at
+   each scale of the first stage of the MTCNN.
+"""
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+__author__ = "Iván de Paz Centeno"
+
+
+def _sort_boxes(boxes, pixel_offset):
+    """
+    Sorts the boxes by decreasing score.
+    :return: tuple (order, x1, y1, x2, y2, area) with the coordinates already sorted
+    """
+    order = np.argsort(boxes[:, 4], kind="stable")[::-1]
+    x1, y1, x2, y2 = (np.ascontiguousarray(boxes[order, i], dtype=np.float64) for i in range(4))
+    area = (x2 - x1 + pixel_offset) * (y2 - y1 + pixel_offset)
+
+    return order, x1, y1, x2, y2, area
+
+
+def _overlap(i, idx, x1, y1, x2, y2, area, method, pixel_offset):
+    """
+    Computes the overlap of box i with the boxes idx.
+    """
+    xx1 = np.maximum(x1[i], x1[idx])
+    yy1 = np.maximum(y1[i], y1[idx])
+    xx2 = np.minimum(x2[i], x2[idx])
+    yy2 = np.minimum(y2[i], y2[idx])
+
+    w = np.maximum(0.0, xx2 - xx1 + pixel_offset)
+    h = np.maximum(0.0, yy2 - yy1 + pixel_offset)
+
+    inter = w * h
+
+    if method == 'Min':
+        return inter / np.minimum(area[i], area[idx])
+
+    return inter / (area[i] + area[idx] - inter)
+
+
+def nms_numpy(boxes, threshold: float, method: str = 'Union', pixel_offset: float = 1):
+    """
+    Non Maximum Suppression implemented with numpy.
+    """
+    order, x1, y1, x2, y2, area = _sort_boxes(boxes, pixel_offset)
+
+    pick = np.empty(order.shape[0], dtype=np.int64)
+    counter = 0
+    remaining = np.arange(order.shape[0])
+
+    while remaining.size > 0:
+        i = remaining[0]
+        pick[counter] = i
+        counter += 1
+
+        idx = remaining[1:]
+        o = _overlap(i, idx, x1, y1, x2, y2, area, method, pixel_offset)
+        remaining = idx[o <= threshold]
+
+    return order[pick[0:counter]]
+
+
+if numba is not None:
+    @numba.njit(cache=True)
+    def _nms_kernel(x1, y1, x2, y2, area, threshold, use_min, pixel_offset):
+        count = x1.shape[0]
+        suppressed = np.zeros(count, dtype=np.bool_)
+        pick = np.empty(count, dtype=np.int64)
+        counter = 0
+
+        for i in range(count):
+            if suppressed[i]:
+                continue
+
+            pick[counter] = i
+            counter += 1
+
+            for j in range(i + 1, count):
+                if suppressed[j]:
+                    continue
+
+                w = min(x2[i], x2[j]) - max(x1[i], x1[j]) + pixel_offset
+                h = min(y2[i], y2[j]) - max(y1[i], y1[j]) + pixel_offset
+
+                if w <= 0 or h <= 0:
+                    inter = 0.0
+                else:
+                    inter = w * h
+
+                if use_min:
+                    o = inter / min(area[i], area[j])
+                else:
+                    o = inter / (area[i] + area[j] - inter)
+
+                if o > threshold:
+                    suppressed[j] = True
+
+        return pick[0:counter]
+
+
+def nms_numba(boxes, threshold: float, method: str = 'Union', pixel_offset: float = 1):
+    """
+    Non Maximum Suppression compiled with numba.
+    """
+    order, x1, y1, x2, y2, area = _sort_boxes(boxes, pixel_offset)
+    pick = _nms_kernel(x1, y1, x2, y2, area, float(threshold), method == 'Min', float(pixel_offset))
+
+    return order[pick]
+
+
+def nms_grid(boxes, threshold: float, method: str = 'Union', pixel_offset: float = 1):
+    """
+    Non Maximum Suppression comparing only the boxes that lie in neighbouring cells of a grid.
+    """
+    order, x1, y1, x2, y2, area = _sort_boxes(boxes, pixel_offset)
+    count = order.shape[0]
+
+    # Two boxes can only overlap if their top-left corners are closer than the biggest box
+    cell = max((x2 - x1).max(), (y2 - y1).max(), 0) + max(pixel_offset, 0) + 1
+    col = ((x1 - x1.min()) // cell).astype(np.int64)
+    row = ((y1 - y1.min()) // cell).astype(np.int64)
+    cols = col.max() + 3
+
+    # Cells are numbered with a border of one cell, so that the neighbours of any cell have valid numbers
+    key = (row + 1) * cols + (col + 1)
+    by_key = np.argsort(key, kind="stable")
+    sorted_keys = key[by_key]
+
+    neighbours = np.array([dy * cols + dx for dy in (-1, 0, 1) for dx in (-1, 0, 1)])
+    starts = np.searchsorted(sorted_keys, key[:, None] + neighbours, side="left")
+    ends = np.searchsorted(sorted_keys, key[:, None] + neighbours, side="right")
+
+    suppressed = np.zeros(count, dtype=np.bool_)
+    pick = np.empty(count, dtype=np.int64)
+    counter = 0
+
+    for i in range(count):
+        if suppressed[i]:
+            continue
+
+        pick[counter] = i
+        counter += 1
+
+        idx = np.concatenate([by_key[start:end] for start, end in zip(starts[i], ends[i]) if start < end])
+        idx = idx[(idx > i) & ~suppressed[idx]]
+
+        if idx.size > 0:
+            o = _overlap(i, idx, x1, y1, x2, y2, area, method, pixel_offset)
+            suppressed[idx[o > threshold]] = True
+
+    return order[pick[0:counter]]
+
+
+BACKENDS = {
+    "numpy": nms_numpy,
+    "grid": nms_grid,
+}
+
+if numba is not None:
+    BACKENDS["numba"] = nms_numba
+
+
+def nms(boxes, threshold: float, method: str = 'Union', backend: str = "numpy", pixel_offset: float = 1):
+    """
+    Non Maximum Suppression.
+
+    :param boxes: np array with bounding boxes, one per row as [x1, y1, x2, y2, score, ...].
+    :param threshold: boxes overlapping a better scored box by more than this threshold are suppressed.
+    :param method: NMS method to apply. Available values ('Min', 'Union')
+    :param backend: implementation to use. Available values are the keys of BACKENDS ('numpy', 'grid' and, if
+    numba is installed, 'numba').
+    :param pixel_offset: value added to the widths and heights of the boxes: 1 for inclusive pixel coordinates (as
+    used by the MTCNN), 0 for continuous coordinates.
+    :return: indexes of the picked boxes, sorted by decreasing score.
+    """
+    if backend not in BACKENDS:
+        raise ValueError("NMS backend {} not available. Available backends: {}".format(backend, list(BACKENDS)))
+
+    if boxes.size == 0:
+        return np.empty((0,), dtype=np.int64)
+
+    return BACKENDS[backend](boxes, threshold, method, pixel_offset)
@@ -0,0 +1,270 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2019 Iván de Paz Centeno
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import Future
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from mtcnn.exceptions import InvalidImage
+from mtcnn.result import FaceList
+
+__author__ = "Iván de Paz Centeno"
+
+def _worker(tasks, results, mtcnn_kwargs: dict):
+    """
+    Main loop of the worker processes: detects the faces of the frames found in the shared memory slots.
+    """
+    from mtcnn.mtcnn import MTCNN
+
+    try:
+        detector = MTCNN(**mtcnn_kwargs)
+        error = None
+    except Exception as e:
+        detector = None
+        error = e
+
+    attached = {}
+
+    for task in iter(tasks.get, None):
+        task_id, slot, name, shape, dtype = task
+
+        if error is not None:
+            results.put((task_id, slot, error))
+            continue
+
+        if slot not in attached or attached[slot].name != name:
+            if slot in attached:
+                attached[slot].close()
+
+            attached[slot] = SharedMemory(name=name)
+
+        frame = np.ndarray(shape, dtype=dtype, buffer=attached[slot].buf)
+
+        try:
+            result = detector.detect_faces(frame, as_array=True)
+        except Exception as e:
+            result = e
+
+        del frame
+        results.put((task_id, slot, result))
+
+    for shared_memory in attached.values():
+        shared_memory.close()
+
+
+class MTCNNPool(object):
+    """
+    Runs MTCNN detections on a pool of worker processes, each of them holding its own MTCNN instance.
+
+    Frames are not pickled to the workers: they are copied into a ring of shared memory slots, and only the arrays with
+    the boxes, confidences and keypoints come back. Submitting blocks while all the slots are in use.
+    """
+
+    def __init__(self, workers: int = None, slots: int = None, context: str = "spawn", **mtcnn_kwargs):
+        """
+        Starts the worker processes.
+        :param workers: number of worker processes. By default, the number of CPUs.
+        :param slots: number of shared memory slots, which bounds the number of frames in flight. By default, twice
+        the number of workers.
+        :param context: multiprocessing start method of the workers. 'spawn' is safe even if TensorFlow is already
+        loaded by the calling process.
+        :param mtcnn_kwargs: arguments for the MTCNN instance of every worker.
+        """
+        workers = workers or multiprocessing.cpu_count()
+        slots = slots or 2 * workers
+        context = multiprocessing.get_context(context)
+
+        self.__tasks = context.Queue()
+        self.__results = context.Queue()
+        self.__shared_memories = [None] * slots
+        self.__free_slots = queue.Queue()
+        self.__futures = {}
+        self.__pending_slots = {}
+        self.__next_task_id = 0
+        self.__lock = threading.Lock()
+        self.__closed = False
+        self.__broken = None
+
+        for slot in range(slots):
+            self.__free_slots.put(slot)
+
+        self.__processes = [context.Process(target=_worker, args=(self.__tasks, self.__results, mtcnn_kwargs),
+                                            daemon=True) for _ in range(workers)]
+
+        for process in self.__processes:
+            process.start()
+
+        self.__dispatcher = threading.Thread(target=self.__dispatch_results, daemon=True)
+        self.__dispatcher.start()
+
+    def __dispatch_results(self):
+        while True:
+            try:
+                message = self.__results.get(timeout=1)
+            except queue.Empty:
+                if not self.__closed and not all(process.is_alive() for process in self.__processes):
+                    self.__fail_pending(RuntimeError("A worker process of the pool terminated abruptly."))
+                continue
+
+            if message is None:
+                break
+
+            task_id, slot, result = message
+
+            with self.__lock:
+                future = self.__futures.pop(task_id, None)
+                pending_slot = self.__pending_slots.pop(task_id, None)
+
+            # the slots of the tasks failed by __fail_pending() are already free
+            if pending_slot is not None:
+                self.__free_slots.put(slot)
+
+            if future is None:
+                continue
+
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(list(FaceList(*result)))
+
+    def __fail_pending(self, error: Exception):
+        """
+        Marks the pool as broken and fails every pending future, as their frames may never be processed. Their slots
+        are freed, so that the submissions waiting for one can fail too.
+        """
+        with self.__lock:
+            self.__broken = error
+            futures, self.__futures = self.__futures, {}
+            slots, self.__pending_slots = self.__pending_slots, {}
+
+        for slot in slots.values():
+            self.__free_slots.put(slot)
+
+        for future in futures.values():
+            future.set_exception(error)
+
+    def __get_free_slot(self) -> int:
+        """
+        Waits for a free shared memory slot, failing if the pool is closed or broken in the meantime.
+        """
+        while True:
+            if self.__closed:
+                raise RuntimeError("The pool is closed.")
+
+            if self.__broken is not None:
+                raise self.__broken
+
+            try:
+                return self.__free_slots.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+    def __copy_to_slot(self, slot: int, img) -> str:
+        shared_memory = self.__shared_memories[slot]
+
+        if shared_memory is None or shared_memory.size < img.nbytes:
+            if shared_memory is not None:
+                shared_memory.close()
+                shared_memory.unlink()
+
+            shared_memory = self.__shared_memories[slot] = SharedMemory(create=True, size=max(img.nbytes, 1))
+
+        np.ndarray(img.shape, dtype=img.dtype, buffer=shared_memory.buf)[...] = img
+        return shared_memory.name
+
+    def submit(self, img) -> Future:
+        """
+        Queues the detection of the faces of an image.
+        :param img: image to process
+        :return: future resolved with the list of bounding boxes detected with their keypoints.
+        """
+        if self.__closed:
+            raise RuntimeError("The pool is closed.")
+
+        if self.__broken is not None:
+            raise self.__broken
+
+        if img is None or not hasattr(img, "shape"):
+            raise InvalidImage("Image not valid.")
+
+        img = np.asarray(img)
+        slot = self.__get_free_slot()
+        future = Future()
+
+        with self.__lock:
+            if self.__broken is not None:
+                self.__free_slots.put(slot)
+                raise self.__broken
+
+            task_id = self.__next_task_id
+            self.__next_task_id += 1
+            self.__futures[task_id] = future
+            self.__pending_slots[task_id] = slot
+
+        self.__tasks.put((task_id, slot, self.__copy_to_slot(slot, img), img.shape, img.dtype.str))
+
+        return future
+
+    def map(self, images) -> list:
+        """
+        Detects the faces of several images, blocking until all of them are processed.
+        :param images: iterable of images to process
+        :return: list with, for each image, the list of bounding boxes detected with their keypoints.
+        """
+        futures = [self.submit(img) for img in images]
+        return [future.result() for future in futures]
+
+    def close(self):
+        """
+        Stops the worker processes once the queued frames are processed, and releases the shared memory.
+        """
+        if self.__closed:
+            return
+
+        self.__closed = True
+
+        for _ in self.__processes:
+            self.__tasks.put(None)
+
+        for process in self.__processes:
+            process.join()
+
+        self.__results.put(None)
+        self.__dispatcher.join()
+
+        for shared_memory in self.__shared_memories:
+            if shared_memory is not None:
+                shared_memory.close()
+                shared_memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,188 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2019 Iván de Paz Centeno
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Instrumentation of the MTCNN detections.
+
+A Profiler attached to an MTCNN instance records histograms of:
+
+ - the wall time of each part of the detection (metric 'duration_seconds', labelled by operation: 'detect_faces',
+   'pyramid', 'pnet', 'generate_boxes', 'nms', 'stage2_crops', 'rnet', 'stage3_crops', 'onet', 'result', ...),
+ - the number of candidate boxes left after each stage (metric 'boxes', labelled by stage),
+ - the batch sizes fed to each network (metric 'batch_size', labelled by network).
+
+When no profiler is attached, the instrumentation points of MTCNN reduce to an attribute check.
+
+    >>> detector = MTCNN()
+    >>> with detector.profile() as profiler:
+    ...     detector.detect_faces(img)
+    >>> print(profiler.to_prometheus())
+"""
+
+import threading
+import time
+from contextlib import nullcontext
+
+__author__ = "Iván de Paz Centeno"
+
+NULL_CONTEXT = nullcontext()
+
+METRICS = {
+    "duration_seconds": ("operation", "Wall time of each part of the MTCNN detection, in seconds.",
+                         (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)),
+    "boxes": ("stage", "Number of candidate boxes left after each stage of MTCNN.",
+              (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)),
+    "batch_size": ("network", "Number of inputs fed to each network of MTCNN in a single call.",
+                   (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)),
+}
+
+
+class _Histogram(object):
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+class _Timer(object):
+
+    __slots__ = ("profiler", "operation", "start")
+
+    def __init__(self, profiler, operation: str):
+        self.profiler = profiler
+        self.operation = operation
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.profiler.observe("duration_seconds", self.operation, time.perf_counter() - self.start)
+
+
+class Profiler(object):
+    """
+    Collects the histograms of the instrumented metrics of MTCNN.
+    """
+
+    def __init__(self, callback=None):
+        """
+        :param callback: optional callable invoked for each observation as callback(metric, label, value), for example
+        to forward them to another monitoring system.
+        """
+        self.__callback = callback
+        self.__lock = threading.Lock()
+        self.__histograms = {}
+
+    def time(self, operation: str) -> _Timer:
+        """
+        Context manager recording the wall time of the enclosed block under the given operation.
+        """
+        return _Timer(self, operation)
+
+    def observe(self, metric: str, label: str, value: float):
+        """
+        Records a value of a metric.
+        :param metric: one of the keys of METRICS.
+        :param label: value of the label of the metric (operation, stage or network).
+        :param value: value to record.
+        """
+        with self.__lock:
+            histogram = self.__histograms.get((metric, label))
+
+            if histogram is None:
+                histogram = self.__histograms[metric, label] = _Histogram(METRICS[metric][2])
+
+            histogram.observe(value)
+
+        if self.__callback is not None:
+            self.__callback(metric, label, value)
+
+    def reset(self):
+        """
+        Discards all the recorded values.
+        """
+        with self.__lock:
+            self.__histograms = {}
+
+    def summary(self) -> dict:
+        """
+        :return: dict with, for each metric and label, the number of observations, their sum and their mean.
+        """
+        with self.__lock:
+            items = sorted(self.__histograms.items())
+
+        result = {}
+
+        for (metric, label), histogram in items:
+            result.setdefault(metric, {})[label] = {"count": histogram.count, "sum": histogram.sum,
+                                                    "mean": histogram.sum / histogram.count}
+
+        return result
+
+    def to_prometheus(self, prefix: str = "mtcnn") -> str:
+        """
+        Exports the recorded histograms in the Prometheus text exposition format.
+        :param prefix: prefix of the metric names.
+        :return: text with one histogram per metric.
+        """
+        with self.__lock:
+            items = sorted(self.__histograms.items())
+
+        lines = []
+
+        for metric, (label_name, description, _) in METRICS.items():
+            histograms = [(label, histogram) for (name, label), histogram in items if name == metric]
+
+            if not histograms:
+                continue
+
+            name = "{}_{}".format(prefix, metric)
+            lines.append("# HELP {} {}".format(name, description))
+            lines.append("# TYPE {} histogram".format(name))
+
+            for label, histogram in histograms:
+                cumulative = 0
+
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append('{}_bucket{{{}="{}",le="{}"}} {}'.format(name, label_name, label, bound, cumulative))
+
+                lines.append('{}_bucket{{{}="{}",le="+Inf"}} {}'.format(name, label_name, label, histogram.count))
+                lines.append('{}_sum{{{}="{}"}} {}'.format(name, label_name, label, histogram.sum))
+                lines.append('{}_count{{{}="{}"}} {}'.format(name, label_name, label, histogram.count))
+
+        return "\n".join(lines) + "\n"
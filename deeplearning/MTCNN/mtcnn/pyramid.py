@@ -0,0 +1,200 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2019 Iván de Paz Centeno
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+__author__ = "Iván de Paz Centeno"
+
+# The pixels are mapped from [0, 255] to [-1, 1] as (pixel - 127.5) * 0.0078125
+NORMALIZATION_SCALE = 0.0078125
+NORMALIZATION_OFFSET = -127.5 * NORMALIZATION_SCALE
+
+
+def normalize(image, out):
+    """
+    Normalizes the pixels of an image into a float32 buffer in a single pass, without float64 temporaries.
+    :param image: image to normalize
+    :param out: float32 buffer with the shape of the image, where the normalized pixels are written
+    :return: the out buffer
+    """
+    if out.flags.c_contiguous and out.ndim <= 3:
+        cv2.addWeighted(image, NORMALIZATION_SCALE, image, 0, NORMALIZATION_OFFSET, dst=out, dtype=cv2.CV_32F)
+    else:
+        # Views with arbitrary strides can not be written by OpenCV
+        np.multiply(image, np.float32(NORMALIZATION_SCALE), out=out, dtype=np.float32)
+        out += np.float32(NORMALIZATION_OFFSET)
+
+    return out
+
+
+class ImagePyramid(object):
+    """
+    Builds the scale pyramid of the first stage of the MTCNN.
+
+    Each level is derived from the previous one instead of from the full resolution image, and the levels are kept in
+    buffers that are reused for the next images of the same shape (the common case when processing video frames).
+    The returned levels are views of those buffers, so they are only valid until the next pyramid of the same shape is
+    built by the same thread: the buffers are pooled per thread, so that an ImagePyramid can be shared among threads.
+    """
+
+    # Space left between the levels packed in a canvas. The networks only read one row/column past the edge of a
+    # level (when its size is odd), so a small even gutter keeps the levels apart and their offsets aligned to the
+    # stride of the P network.
+    GUTTER = 2
+
+    def __init__(self, max_cached_shapes: int = 4):
+        """
+        Initializes the pyramid builder.
+        :param max_cached_shapes: maximum number of image shapes whose buffers are kept in the pool.
+        """
+        self.__max_cached_shapes = max_cached_shapes
+        self.__local = threading.local()
+
+    def __pools(self) -> tuple:
+        """
+        Retrieves the pools of buffers of the calling thread, creating them on its first call.
+        :return: tuple (pool, canvas_pool)
+        """
+        if not hasattr(self.__local, "pool"):
+            self.__local.pool = OrderedDict()
+            self.__local.canvas_pool = OrderedDict()
+
+        return self.__local.pool, self.__local.canvas_pool
+
+    @staticmethod
+    def level_sizes(height: int, width: int, scales: list) -> list:
+        """
+        Computes the size of each level of the pyramid.
+        :param height: height of the image
+        :param width: width of the image
+        :param scales: scales of the pyramid
+        :return: list of (height, width) tuples
+        """
+        return [(int(np.ceil(height * scale)), int(np.ceil(width * scale))) for scale in scales]
+
+    @classmethod
+    def pack_layout(cls, sizes: list) -> tuple:
+        """
+        Computes where each level is placed when packing the pyramid in a single canvas.
+
+        The first (biggest) level is placed at the top-left corner and the rest are stacked in columns at its right,
+        starting a new column whenever a level does not fit under the previous one.
+        :param sizes: sizes of the levels, in decreasing order
+        :return: tuple ((canvas_height, canvas_width), offsets) where offsets are the (y, x) of each level
+        """
+        def align(value):
+            return value + value % 2
+
+        canvas_height = align(sizes[0][0])
+        offsets = []
+        column_x = column_width = y = 0
+
+        for height, width in sizes:
+            if y > 0 and y + height > canvas_height:
+                column_x = align(column_x + column_width + cls.GUTTER)
+                column_width = y = 0
+
+            offsets.append((y, column_x))
+            column_width = max(column_width, width)
+            y = align(y + height + cls.GUTTER)
+
+        canvas_width = align(column_x + column_width)
+
+        return (canvas_height, canvas_width), offsets
+
+    def pack(self, levels: list) -> tuple:
+        """
+        Packs the levels of a pyramid in a single canvas, so that the P network can process all of them at once.
+        :param levels: normalized levels, as returned by build()
+        :return: tuple (canvas, offsets) where offsets are the (y, x) of each level inside the canvas
+        """
+        sizes = [level.shape[0:2] for level in levels]
+        (height, width), offsets = self.pack_layout(sizes)
+
+        _, canvas_pool = self.__pools()
+        key = (tuple(sizes), levels[0].shape[2:])
+        canvas = canvas_pool.pop(key, None)
+
+        if canvas is None:
+            canvas = np.zeros(shape=(height, width) + levels[0].shape[2:], dtype=np.float32)
+
+            while len(canvas_pool) >= self.__max_cached_shapes:
+                canvas_pool.popitem(last=False)
+
+        canvas_pool[key] = canvas
+
+        # Only the levels are overwritten, the gutters keep their zeros
+        for (y, x), level in zip(offsets, levels):
+            canvas[y:y + level.shape[0], x:x + level.shape[1]] = level
+
+        return canvas, offsets
+
+    def __buffers(self, image, sizes: list) -> list:
+        """
+        Retrieves from the pool the buffers for the levels of the given image, allocating them if required.
+        :param image: image to build the pyramid for
+        :param sizes: sizes of the levels
+        :return: list of (resized, normalized) buffers for each level
+        """
+        pool, _ = self.__pools()
+        key = (image.shape, image.dtype.str, tuple(sizes))
+        buffers = pool.pop(key, None)
+
+        if buffers is None:
+            channels = image.shape[2:]
+            buffers = [(np.empty(shape=(height, width) + channels, dtype=image.dtype),
+                        np.empty(shape=(height, width) + channels, dtype=np.float32)) for height, width in sizes]
+
+            while len(pool) >= self.__max_cached_shapes:
+                pool.popitem(last=False)
+
+        pool[key] = buffers
+        return buffers
+
+    def build(self, image, scales: list) -> list:
+        """
+        Builds the pyramid of an image.
+        :param image: image to scale
+        :param scales: scales of the pyramid, in decreasing order
+        :return: list with the normalized float32 image for each scale
+        """
+        height, width = image.shape[0:2]
+        sizes = self.level_sizes(height, width, scales)
+
+        levels = []
+        source = image
+
+        for (height, width), (resized, normalized) in zip(sizes, self.__buffers(image, sizes)):
+            cv2.resize(source, (width, height), dst=resized, interpolation=cv2.INTER_AREA)
+
+            levels.append(normalize(resized, normalized))
+            source = resized
+
+        return levels
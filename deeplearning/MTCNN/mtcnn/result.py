@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2019 Iván de Paz Centeno
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from collections.abc import Sequence
+
+import numpy as np
+
+__author__ = "Iván de Paz Centeno"
+
+KEYPOINTS = ['left_eye', 'right_eye', 'nose', 'mouth_left', 'mouth_right']
+
+
+def to_arrays(total_boxes, points) -> tuple:
+    """
+    Converts the output of the last stage of MTCNN into compact arrays.
+    :param total_boxes: bounding boxes obtained from the third stage, as [x1, y1, x2, y2, score].
+    :param points: keypoints obtained from the third stage, with shape (10, N).
+    :return: tuple (boxes, scores, landmarks) of float32 arrays with shapes (N, 4), (N,) and (N, 5, 2). Boxes are
+    formatted as [x, y, width, height] and landmarks as (x, y), in the order given by KEYPOINTS.
+    """
+    if total_boxes.size == 0:
+        return (np.empty((0, 4), dtype=np.float32), np.empty((0,), dtype=np.float32),
+                np.empty((0, 5, 2), dtype=np.float32))
+
+    x = np.maximum(total_boxes[:, 0], 0)
+    y = np.maximum(total_boxes[:, 1], 0)
+
+    boxes = np.stack([x, y, total_boxes[:, 2] - x, total_boxes[:, 3] - y], axis=1).astype(np.float32)
+    scores = total_boxes[:, -1].astype(np.float32)
+    landmarks = np.stack([points[0:5].T, points[5:10].T], axis=2).astype(np.float32)
+
+    return boxes, scores, landmarks
+
+
+class FaceList(Sequence):
+    """
+    Read-only view of the arrays returned by MTCNN.detect_faces(img, as_array=True) as the list of dicts returned by
+    MTCNN.detect_faces(img). The arrays are not copied: each dict is built when its face is accessed.
+
+    Values match the ones of the dicts built by MTCNN up to the float32 rounding of the arrays.
+    """
+
+    def __init__(self, boxes, scores, landmarks):
+        self.boxes = boxes
+        self.scores = scores
+        self.landmarks = landmarks
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return FaceList(self.boxes[index], self.scores[index], self.landmarks[index])
+
+        box = self.boxes[index]
+        x, y = int(box[0]), int(box[1])
+
+        return {
+            'box': [x, y, int(box[0] + box[2] - x), int(box[1] + box[3] - y)],
+            'confidence': float(self.scores[index]),
+            'keypoints': {name: (int(point[0]), int(point[1])) for name, point in zip(KEYPOINTS, self.landmarks[index])}
+        }
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence):
+            return NotImplemented
+
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return repr(list(self))
@@ -0,0 +1,164 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2019 Iván de Paz Centeno
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import cv2
+import numpy as np
+
+from mtcnn.exceptions import InvalidImage
+from mtcnn.mtcnn import MTCNN
+
+__author__ = "Iván de Paz Centeno"
+
+
+def box_iou(boxes_a, boxes_b):
+    """
+    Computes the intersection over union between two sets of boxes.
+    :param boxes_a: array of shape (N, 4) with boxes as [x, y, width, height]
+    :param boxes_b: array of shape (M, 4) with boxes as [x, y, width, height]
+    :return: array of shape (N, M)
+    """
+    a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 1, 4)
+    b = np.asarray(boxes_b, dtype=np.float64).reshape(1, -1, 4)
+
+    width = np.minimum(a[..., 0] + a[..., 2], b[..., 0] + b[..., 2]) - np.maximum(a[..., 0], b[..., 0])
+    height = np.minimum(a[..., 1] + a[..., 3], b[..., 1] + b[..., 3]) - np.maximum(a[..., 1], b[..., 1])
+    intersection = np.maximum(width, 0) * np.maximum(height, 0)
+    union = a[..., 2] * a[..., 3] + b[..., 2] * b[..., 3] - intersection
+
+    return intersection / np.maximum(union, 1e-9)
+
+
+class VideoMTCNN(object):
+    """
+    Detects faces in the frames of a video, taking advantage of the temporal coherence between them.
+
+    The full MTCNN (including the scale pyramid of the first stage) only runs on keyframes: every keyframe_interval
+    frames, when a scene change is detected, or when no face is being tracked. On the frames in between, the second and
+    third stages are seeded with the faces of the previous frame, slightly expanded, which is much cheaper. Faces are
+    matched across frames by overlap, and each face carries an 'id' that stays the same while it is tracked.
+    """
+
+    THUMBNAIL_SIZE = 32
+
+    def __init__(self, detector: MTCNN = None, keyframe_interval: int = 10, box_expansion: float = 0.2,
+                 scene_change_threshold: float = 0.15, iou_threshold: float = 0.3, **mtcnn_kwargs):
+        """
+        Initializes the video detector.
+        :param detector: MTCNN instance to use. If None, a new instance is built with mtcnn_kwargs.
+        :param keyframe_interval: maximum number of frames between two full detections.
+        :param box_expansion: fraction by which the boxes of the previous frame are enlarged to seed the next frame.
+        :param scene_change_threshold: mean absolute difference (between 0 and 1) between the thumbnails of two
+        consecutive frames above which a full detection is run.
+        :param iou_threshold: minimum overlap for a face to be considered the same as a face of the previous frame.
+        :param mtcnn_kwargs: arguments for the MTCNN instance, if detector is None.
+        """
+        self.__detector = detector if detector is not None else MTCNN(**mtcnn_kwargs)
+        self.__keyframe_interval = keyframe_interval
+        self.__box_expansion = box_expansion
+        self.__scene_change_threshold = scene_change_threshold
+        self.__iou_threshold = iou_threshold
+
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets the tracked faces, so that the next frame is a keyframe.
+        """
+        self.__faces = []
+        self.__thumbnail = None
+        self.__frames_since_keyframe = 0
+        self.__next_id = 0
+
+    def __scene_changed(self, frame) -> bool:
+        thumbnail = cv2.resize(frame, (self.THUMBNAIL_SIZE, self.THUMBNAIL_SIZE),
+                               interpolation=cv2.INTER_AREA).astype(np.float32)
+        previous, self.__thumbnail = self.__thumbnail, thumbnail
+
+        return previous is None or np.mean(np.abs(thumbnail - previous)) / 255 > self.__scene_change_threshold
+
+    def __seed_boxes(self):
+        boxes = np.array([face['box'] for face in self.__faces], dtype=np.float64).reshape(-1, 4)
+        margin = boxes[:, 2:4] * self.__box_expansion / 2
+
+        return np.hstack([boxes[:, 0:2] - margin, boxes[:, 0:2] + boxes[:, 2:4] + margin])
+
+    def __assign_ids(self, faces: list):
+        """
+        Gives to each face the id of the face of the previous frame that overlaps it the most, or a new id.
+        """
+        ious = box_iou([face['box'] for face in faces], [face['box'] for face in self.__faces])
+        assigned = set()
+
+        for index in np.argsort(-ious, axis=None, kind="stable"):
+            i, j = np.unravel_index(index, ious.shape)
+
+            if ious[i, j] < self.__iou_threshold:
+                break
+
+            if 'id' in faces[i] or j in assigned:
+                continue
+
+            faces[i]['id'] = self.__faces[j]['id']
+            assigned.add(j)
+
+        for face in faces:
+            if 'id' not in face:
+                face['id'] = self.__next_id
+                self.__next_id += 1
+
+    def detect(self, frame) -> list:
+        """
+        Detects the faces of the next frame of the video.
+        :param frame: image to process
+        :return: list containing all the bounding boxes detected with their keypoints and their track id.
+        """
+        if frame is None or not hasattr(frame, "shape"):
+            raise InvalidImage("Image not valid.")
+
+        scene_changed = self.__scene_changed(frame)
+
+        if scene_changed or not self.__faces or self.__frames_since_keyframe + 1 >= self.__keyframe_interval:
+            faces = self.__detector.detect_faces(frame)
+            self.__frames_since_keyframe = 0
+        else:
+            faces = self.__detector._refine_faces(frame, self.__seed_boxes())
+            self.__frames_since_keyframe += 1
+
+        if scene_changed:
+            self.__faces = []
+
+        self.__assign_ids(faces)
+        self.__faces = faces
+
+        return faces
+
+    def detect_stream(self, frames):
+        """
+        Detects the faces of a sequence of frames.
+        :param frames: iterable with the frames of the video
+        :return: generator yielding, for each frame, the list of faces returned by detect().
+        """
+        for frame in frames:
+            yield self.detect(frame)
@@ -36,8 +36,8 @@ def readme():
         return f.read()
 
 
-if sys.version_info < (3, 4, 1):
-    sys.exit('Python < 3.4.1 is not supported!')
+if sys.version_info < (3, 8):
+    sys.exit('Python < 3.8 is not supported!')
 
 
 setup(name='mtcnn',
@@ -48,9 +48,11 @@ setup(name='mtcnn',
       author='Iván de Paz Centeno',
       author_email='ipazc@unileon.es',
       license='MIT',
-      packages=setuptools.find_packages(exclude=["tests.*", "tests"]),
+      packages=setuptools.find_packages(exclude=["tests.*", "tests", "benchmarks.*", "benchmarks"]),
+      python_requires=">=3.8",
       install_requires=[
           "keras>=2.0.0",
+          "numpy>=1.20.0",
           "opencv-python>=4.1.0"
       ],
       classifiers=[
@@ -59,10 +61,8 @@ setup(name='mtcnn',
           'Intended Audience :: Education',
           'Intended Audience :: Science/Research',
           'Natural Language :: English',
-          'Programming Language :: Python :: 3.4',
-          'Programming Language :: Python :: 3.5',
-          'Programming Language :: Python :: 3.6',
-          'Programming Language :: Python :: 3.7',
+          'Programming Language :: Python :: 3.8',
+          'Programming Language :: Python :: 3.9',
       ],
       test_suite='nose.collector',
       tests_require=['nose'],
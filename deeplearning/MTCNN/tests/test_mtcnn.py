@@ -1,8 +1,21 @@
+import asyncio
+import concurrent.futures
+import multiprocessing
+import os
+import signal
+import tempfile
+import threading
+import time
 import unittest
 import cv2
+import numpy as np
 
 from mtcnn.exceptions import InvalidImage
-from mtcnn import MTCNN
+from mtcnn import MTCNN, MTCNNPool, AsyncMTCNN, VideoMTCNN, FaceList, Profiler
+from mtcnn.network.quantization import quantize, save_quantized
+from mtcnn.network.weights import load_weights, save_weights
+from mtcnn.nms import nms, BACKENDS as NMS_BACKENDS
+from mtcnn.pyramid import ImagePyramid, normalize
 
 mtcnn = None
 
@@ -45,6 +58,128 @@ class TestMTCNN(unittest.TestCase):
         self.assertEqual(len(keypoints['left_eye']), 2)
         self.assertEqual(len(keypoints['right_eye']), 2)
 
+    def test_detect_faces_as_array(self):
+        """
+        MTCNN returns the faces as arrays, which can be viewed as the list of dicts.
+        :return:
+        """
+        ivan = cv2.imread("ivan.jpg")
+        no_faces = cv2.imread("no-faces.jpg")
+
+        boxes, scores, landmarks = mtcnn.detect_faces(ivan, as_array=True)
+        expected = mtcnn.detect_faces(ivan)
+
+        self.assertEqual(boxes.shape, (1, 4))
+        self.assertEqual(scores.shape, (1,))
+        self.assertEqual(landmarks.shape, (1, 5, 2))
+        self.assertEqual(boxes.dtype, np.float32)
+
+        faces = FaceList(boxes, scores, landmarks)
+
+        self.assertEqual(len(faces), 1)
+        self.assertListEqual(faces[0]['box'], expected[0]['box'])
+        self.assertDictEqual(faces[0]['keypoints'], expected[0]['keypoints'])
+        self.assertAlmostEqual(faces[0]['confidence'], expected[0]['confidence'], places=5)
+
+        boxes, scores, landmarks = mtcnn.detect_faces(no_faces, as_array=True)
+
+        self.assertEqual(boxes.shape, (0, 4))
+        self.assertEqual(len(FaceList(boxes, scores, landmarks)), 0)
+
+    def test_profiler(self):
+        """
+        A profiler attached to MTCNN records the timings, the candidates of each stage and the batch sizes.
+        :return:
+        """
+        ivan = cv2.imread("ivan.jpg")
+        observations = []
+
+        with mtcnn.profile(Profiler(callback=lambda *observation: observations.append(observation))) as profiler:
+            mtcnn.detect_faces(ivan)
+            mtcnn.detect_faces_batch([ivan, ivan])
+
+        self.assertIsNone(mtcnn.profiler)
+        self.assertGreater(len(observations), 0)
+
+        summary = profiler.summary()
+
+        for operation in ["detect_faces", "detect_faces_batch", "pyramid", "pnet", "nms", "rnet", "onet", "result"]:
+            self.assertIn(operation, summary["duration_seconds"])
+
+        self.assertEqual(summary["boxes"]["stage3"]["count"], 3)
+        self.assertEqual(summary["boxes"]["stage3"]["sum"], 3)
+        self.assertEqual(summary["batch_size"]["onet"]["count"], 2)
+
+        exported = profiler.to_prometheus()
+
+        self.assertIn("# TYPE mtcnn_duration_seconds histogram", exported)
+        self.assertIn('mtcnn_boxes_count{stage="stage3"} 3', exported)
+        self.assertIn('mtcnn_batch_size_bucket{network="pnet",le="+Inf"}', exported)
+
+    def test_steps_max_candidates(self):
+        """
+        MTCNN keeps only the best candidates of each step when they are capped, and skips the next stages when there
+        is no candidate left.
+        :return:
+        """
+        detector = MTCNN(steps_max_candidates=[5, 1])
+        ivan = cv2.imread("ivan.jpg")
+
+        with detector.profile() as profiler:
+            result = detector.detect_faces(ivan)
+            detector.detect_faces(np.zeros((100, 100, 3), dtype=np.uint8))
+
+        expected = mtcnn.detect_faces(ivan)
+        summary = profiler.summary()
+
+        self.assertEqual(len(result), 1)
+        self.assertListEqual(result[0]['box'], expected[0]['box'])
+
+        self.assertEqual(summary["boxes"]["stage1"]["count"], 2)
+        self.assertLessEqual(summary["boxes"]["stage1"]["sum"], 5)
+        self.assertEqual(summary["boxes"]["stage2"]["count"], 1)
+        self.assertEqual(summary["boxes"]["stage2"]["sum"], 1)
+
+    def test_detect_faces_roi(self):
+        """
+        MTCNN looks for faces only inside the region of interest, and reports them in the coordinates of the image.
+        :return:
+        """
+        ivan = cv2.imread("ivan.jpg")
+
+        result = mtcnn.detect_faces(ivan, roi=[200, 40, 200, 180])
+        expected = mtcnn.detect_faces(ivan[40:220, 200:400].copy())
+
+        self.assertEqual(len(result), 1)
+        self.assertListEqual(result[0]['box'], [expected[0]['box'][0] + 200, expected[0]['box'][1] + 40] +
+                             expected[0]['box'][2:])
+
+        boxes, _, landmarks = mtcnn.detect_faces(ivan, roi=[200, 40, 200, 180], as_array=True)
+        expected_boxes, _, expected_landmarks = mtcnn.detect_faces(ivan[40:220, 200:400].copy(), as_array=True)
+
+        np.testing.assert_allclose(boxes[:, 0:2], expected_boxes[:, 0:2] + [200, 40], atol=1e-3)
+        np.testing.assert_allclose(landmarks, expected_landmarks + [200, 40], atol=1e-3)
+
+        self.assertEqual(len(mtcnn.detect_faces(ivan, roi=[0, 0, 150, 150])), 0)
+        self.assertEqual(len(mtcnn.detect_faces(ivan, roi=[600, 600, 100, 100])), 0)
+
+        with self.assertRaises(ValueError):
+            mtcnn.detect_faces(ivan, roi=[0, 0, -10, 10])
+
+    def test_detect_faces_max_face_size(self):
+        """
+        MTCNN skips the levels of the pyramid that would only find faces bigger than the maximum face size.
+        :return:
+        """
+        ivan = cv2.imread("ivan.jpg")
+
+        result = mtcnn.detect_faces(ivan, max_face_size=100)
+        expected = mtcnn.detect_faces(ivan)
+
+        self.assertEqual(len(result), 1)
+        self.assertListEqual(result[0]['box'], expected[0]['box'])
+        self.assertEqual(len(mtcnn.detect_faces(ivan, max_face_size=10)), 0)
+
     def test_detect_faces_invalid_content(self):
         """
         MTCNN detects invalid images
@@ -82,6 +217,460 @@ class TestMTCNN(unittest.TestCase):
         self.assertEqual(len(faces_1), 1)
         self.assertGreater(len(faces_2), 1)
 
+    def test_detect_faces_concurrent(self):
+        """
+        An instance of MTCNN can be shared among threads: the pyramid buffers of each thread are left untouched.
+        :return:
+        """
+        ivan = cv2.imread("ivan.jpg")
+        noise = np.random.RandomState(0).randint(0, 256, size=ivan.shape, dtype=np.uint8)
+
+        for detector in [mtcnn, MTCNN(backend="numpy"), MTCNN(pack_pyramid=True)]:
+            expected = [detector.detect_faces(ivan), detector.detect_faces(noise)]
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+                futures = [executor.submit(detector.detect_faces, image) for _ in range(15) for image in [ivan, noise]]
+                results = [future.result() for future in futures]
+
+            for index, result in enumerate(results):
+                self.assertEqual(result, expected[index % 2])
+
+    def test_detect_faces_batch(self):
+        """
+        MTCNN detects the same faces when the images are processed in a batch.
+        :return:
+        """
+        ivan = cv2.imread("ivan.jpg")
+        no_faces = cv2.imread("no-faces.jpg")
+
+        result = mtcnn.detect_faces_batch([ivan, no_faces, ivan])  # type: list
+
+        self.assertEqual(len(result), 3)
+        self.assertEqual(len(result[0]), 1)
+        self.assertEqual(len(result[1]), 0)
+        self.assertEqual(len(result[2]), 1)
+
+        expected = mtcnn.detect_faces(ivan)[0]
+        for detected, expected_value in zip(result[0][0]['box'], expected['box']):
+            self.assertAlmostEqual(detected, expected_value, delta=1)
+
+    def test_detect_files(self):
+        """
+        MTCNN reads the image files in background threads and yields their faces in order.
+        :return:
+        """
+        ivan = cv2.cvtColor(cv2.imread("ivan.jpg"), cv2.COLOR_BGR2RGB)
+        result = list(mtcnn.detect_files(["ivan.jpg", "no-faces.jpg", "ivan.jpg"] * 3, workers=2, prefetch=3))
+
+        expected = mtcnn.detect_faces(ivan)
+
+        self.assertEqual(len(result), 9)
+
+        for faces in result[0::3] + result[2::3]:
+            self.assertEqual(len(faces), 1)
+            self.assertListEqual(faces[0]['box'], expected[0]['box'])
+
+        for faces in result[1::3]:
+            self.assertEqual(len(faces), 0)
+
+        files = mtcnn.detect_files(["ivan.jpg", "example.py", "ivan.jpg"], as_array=True)
+        self.assertEqual(len(next(files)[0]), 1)
+
+        with self.assertRaises(InvalidImage):
+            next(files)
+
+    def test_detect_faces_batch_invalid_content(self):
+        """
+        MTCNN detects invalid images inside a batch
+        :return:
+        """
+        ivan = cv2.imread("ivan.jpg")
+
+        with self.assertRaises(InvalidImage):
+            mtcnn.detect_faces_batch([ivan, None])
+
+    def test_detect_faces_scattered(self):
+        """
+        MTCNN detects faces lying in opposite corners of a large image.
+        :return:
+        """
+        ivan = cv2.imread("ivan.jpg")
+        height, width = ivan.shape[0:2]
+        image = np.zeros(shape=(2160, 3840, 3), dtype=np.uint8)
+        image[:height, :width] = ivan
+        image[-height:, -width:] = ivan
+
+        result = sorted(mtcnn.detect_faces(image), key=lambda face: face['box'][0])
+        expected = mtcnn.detect_faces(ivan)[0]['box']
+
+        self.assertEqual(len(result), 2)
+        for detected, expected_value in zip(result[0]['box'], expected):
+            self.assertAlmostEqual(detected, expected_value, delta=2)
+        for detected, expected_value in zip(result[1]['box'], [expected[0] + 3840 - width, expected[1] + 2160 - height,
+                                                                expected[2], expected[3]]):
+            self.assertAlmostEqual(detected, expected_value, delta=2)
+
+    def test_detect_faces_packed_pyramid(self):
+        """
+        MTCNN detects the same faces when the pyramid is packed in a single canvas.
+        :return:
+        """
+        detector = MTCNN(pack_pyramid=True)
+        ivan = cv2.imread("ivan.jpg")
+
+        result = detector.detect_faces(ivan)
+        expected = mtcnn.detect_faces(ivan)
+
+        self.assertEqual(len(result), len(expected))
+        for detected, expected_value in zip(result[0]['box'], expected[0]['box']):
+            self.assertAlmostEqual(detected, expected_value, delta=1)
+
+    def test_detect_faces_uncompiled_networks(self):
+        """
+        MTCNN detects the same faces whether the networks are compiled or run through Model.predict().
+        :return:
+        """
+        detector = MTCNN(compile_networks=False)
+        ivan = cv2.imread("ivan.jpg")
+
+        result = detector.detect_faces(ivan)
+        expected = mtcnn.detect_faces(ivan)
+
+        self.assertEqual(len(result), len(expected))
+        self.assertListEqual(result[0]['box'], expected[0]['box'])
+        self.assertAlmostEqual(result[0]['confidence'], expected[0]['confidence'], places=5)
+
+    def test_mtcnn_pool(self):
+        """
+        MTCNNPool detects the same faces as MTCNN, both through map() and submit().
+        :return:
+        """
+        ivan = cv2.imread("ivan.jpg")
+        no_faces = cv2.imread("no-faces.jpg")
+
+        with MTCNNPool(workers=2, backend="numpy") as pool:
+            result = pool.map([ivan, no_faces, ivan])
+            future = pool.submit(ivan)
+
+            with self.assertRaises(InvalidImage):
+                pool.submit(None)
+
+            expected = mtcnn.detect_faces(ivan)
+
+            self.assertEqual(len(result), 3)
+            self.assertEqual(len(result[1]), 0)
+
+            for faces in [result[0], result[2], future.result()]:
+                self.assertEqual(len(faces), len(expected))
+                self.assertListEqual(faces[0]['box'], expected[0]['box'])
+                self.assertDictEqual(faces[0]['keypoints'], expected[0]['keypoints'])
+
+    def test_mtcnn_pool_worker_killed(self):
+        """
+        When a worker of MTCNNPool dies, the pending and the waiting submissions fail instead of blocking.
+        :return:
+        """
+        ivan = cv2.imread("ivan.jpg")
+
+        with MTCNNPool(workers=1, slots=1, backend="numpy") as pool:
+            future = pool.submit(ivan)
+
+            # the only slot is in use: this submission waits for it
+            waiting = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+            blocked = waiting.submit(pool.submit, ivan)
+
+            for process in multiprocessing.active_children():
+                os.kill(process.pid, signal.SIGKILL)
+
+            with self.assertRaises(RuntimeError):
+                future.result(timeout=30)
+
+            with self.assertRaises(RuntimeError):
+                blocked.result(timeout=30)
+
+            waiting.shutdown()
+
+            with self.assertRaises(RuntimeError):
+                pool.submit(ivan)
+
+            with self.assertRaises(RuntimeError):
+                pool.map([ivan, ivan, ivan])
+
+    def test_async_mtcnn(self):
+        """
+        AsyncMTCNN resolves every concurrent request with the faces of its own image.
+        :return:
+        """
+        ivan = cv2.imread("ivan.jpg")
+        no_faces = cv2.imread("no-faces.jpg")
+
+        async def detect_all():
+            async with AsyncMTCNN(mtcnn, max_batch_size=2, max_wait=0.01) as detector:
+                with self.assertRaises(InvalidImage):
+                    await detector.detect(None)
+
+                return await asyncio.gather(*[detector.detect(img) for img in [ivan, no_faces, ivan]])
+
+        result = asyncio.run(detect_all())
+        expected = mtcnn.detect_faces(ivan)
+
+        self.assertEqual(len(result), 3)
+        self.assertEqual(len(result[1]), 0)
+
+        for faces in [result[0], result[2]]:
+            self.assertEqual(len(faces), len(expected))
+            self.assertListEqual(faces[0]['box'], expected[0]['box'])
+
+    def test_async_mtcnn_close_in_flight(self):
+        """
+        AsyncMTCNN cancels the requests of the batch being run when it is closed.
+        :return:
+        """
+        ivan = cv2.imread("ivan.jpg")
+        started = threading.Event()
+
+        class SlowDetector(object):
+            def detect_faces_batch(self, images):
+                started.set()
+                time.sleep(0.2)
+                return mtcnn.detect_faces_batch(images)
+
+        async def close_in_flight():
+            detector = AsyncMTCNN(SlowDetector(), max_wait=0)
+            request = asyncio.ensure_future(detector.detect(ivan))
+
+            await asyncio.get_running_loop().run_in_executor(None, started.wait)
+            await detector.close()
+
+            with self.assertRaises(asyncio.CancelledError):
+                await asyncio.wait_for(request, 5)
+
+        asyncio.run(close_in_flight())
+
+    def test_video_mtcnn(self):
+        """
+        VideoMTCNN keeps tracking the same face, with the same id, on the frames between keyframes.
+        :return:
+        """
+        ivan = cv2.imread("ivan.jpg")
+        frames = [np.roll(ivan, shift, axis=1) for shift in range(0, 20, 4)]
+
+        detector = VideoMTCNN(mtcnn, keyframe_interval=10)
+        result = list(detector.detect_stream(frames))
+
+        self.assertEqual(len(result), len(frames))
+
+        for shift, faces in zip(range(0, 20, 4), result):
+            expected = mtcnn.detect_faces(np.roll(ivan, shift, axis=1))
+
+            self.assertEqual(len(faces), 1)
+            self.assertEqual(faces[0]['id'], 0)
+
+            for detected, expected_value in zip(faces[0]['box'], expected[0]['box']):
+                self.assertAlmostEqual(detected, expected_value, delta=4)
+
+        # A scene change triggers a new full detection
+        self.assertEqual(len(detector.detect(cv2.imread("no-faces.jpg"))), 0)
+
+    def test_detect_faces_numpy_backend(self):
+        """
+        MTCNN detects the same faces with the NumPy implementation of the networks.
+        :return:
+        """
+        detector = MTCNN(backend="numpy")
+        ivan = cv2.imread("ivan.jpg")
+
+        result = detector.detect_faces(ivan)
+        expected = mtcnn.detect_faces(ivan)
+
+        self.assertEqual(len(result), len(expected))
+        self.assertListEqual(result[0]['box'], expected[0]['box'])
+        self.assertDictEqual(result[0]['keypoints'], expected[0]['keypoints'])
+        self.assertAlmostEqual(result[0]['confidence'], expected[0]['confidence'], places=5)
+
+        with self.assertRaises(ValueError):
+            MTCNN(backend="onnx")
+
+    def test_detect_faces_tf1_backend(self):
+        """
+        MTCNN detects the same faces with the networks frozen in a TF1 graph.
+        :return:
+        """
+        detector = MTCNN(backend="tf1")
+        ivan = cv2.imread("ivan.jpg")
+
+        result = detector.detect_faces(ivan)
+        expected = mtcnn.detect_faces(ivan)
+
+        self.assertEqual(len(result), len(expected))
+        self.assertListEqual(result[0]['box'], expected[0]['box'])
+        self.assertDictEqual(result[0]['keypoints'], expected[0]['keypoints'])
+        self.assertAlmostEqual(result[0]['confidence'], expected[0]['confidence'], places=5)
+
+    def test_detect_faces_int8_backend(self):
+        """
+        MTCNN detects the same faces, within the quantization error, with the int8 networks.
+        :return:
+        """
+        ivan = cv2.imread("ivan.jpg")
+
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, "mtcnn_weights_int8.npz")
+            save_quantized(quantize([ivan]), file_name)
+            detector = MTCNN(weights_file=file_name, backend="int8")
+
+            with self.assertRaises(FileNotFoundError):
+                MTCNN(weights_file=os.path.join(directory, "missing.npz"), backend="int8")
+
+            with self.assertRaises(ValueError):
+                MTCNN(backend="int8")
+
+        result = detector.detect_faces(ivan)
+        expected = mtcnn.detect_faces(ivan)
+
+        self.assertEqual(len(result), len(expected))
+        for detected, expected_value in zip(result[0]['box'], expected[0]['box']):
+            self.assertAlmostEqual(detected, expected_value, delta=8)
+
+        self.assertEqual(len(detector.detect_faces(cv2.imread("no-faces.jpg"))), 0)
+        self.assertEqual(len(detector.detect_faces_batch([ivan] * 20)), 20)
+
+        with self.assertRaises(ValueError):
+            quantize([np.zeros((100, 100, 3), dtype=np.uint8)])
+
+    def test_compiled_network_batch_buckets(self):
+        """
+        Compiled networks split and pad the batches to fit the compiled batch sizes.
+        :return:
+        """
+        for count in [0, 1, 17, 300]:
+            patches = np.random.rand(count, 24, 24, 3).astype(np.float32)
+            regressions, scores = mtcnn._rnet.predict(patches)
+
+            self.assertEqual(regressions.shape, (count, 4))
+            self.assertEqual(scores.shape, (count, 2))
+
+        patches = np.random.rand(5, 24, 24, 3).astype(np.float32)
+        scores = mtcnn._rnet.predict(patches)[1]
+
+        for patch, score in zip(patches, scores):
+            self.assertTrue(np.allclose(mtcnn._rnet.predict(patch[np.newaxis])[1][0], score, atol=1e-5))
+
+    def test_weights_flat_format(self):
+        """
+        Weights stored in the flat format are memory-mapped and equal to the ones of the legacy .npy file.
+        :return:
+        """
+        expected = load_weights("mtcnn/data/mtcnn_weights.npy")
+
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, "weights.bin")
+            save_weights(expected, file_name)
+            weights = load_weights(file_name)
+
+            for network in ["pnet", "rnet", "onet"]:
+                self.assertEqual(len(weights[network]), len(expected[network]))
+
+                for weight, expected_weight in zip(weights[network], expected[network]):
+                    self.assertIsInstance(weight.base, np.memmap)
+                    self.assertTrue(np.array_equal(weight, expected_weight))
+
+            del weights, weight
+
+    def test_image_pyramid_pack_layout(self):
+        """
+        The levels packed in a canvas are aligned to the stride of the P network and do not overlap.
+        :return:
+        """
+        sizes = ImagePyramid.level_sizes(401, 601, [0.6 * 0.709 ** i for i in range(8)])
+        (height, width), offsets = ImagePyramid.pack_layout(sizes)
+
+        for i, ((y, x), (h, w)) in enumerate(zip(offsets, sizes)):
+            self.assertEqual(y % 2, 0)
+            self.assertEqual(x % 2, 0)
+            self.assertLessEqual(y + h, height)
+            self.assertLessEqual(x + w, width)
+
+            for (y2, x2), (h2, w2) in zip(offsets[i + 1:], sizes[i + 1:]):
+                self.assertTrue(y + h < y2 or y2 + h2 < y or x + w < x2 or x2 + w2 < x)
+
+    def test_image_pyramid_reuses_buffers(self):
+        """
+        The image pyramid reuses its buffers for images of the same shape.
+        :return:
+        """
+        ivan = cv2.imread("ivan.jpg")
+        scales = [0.6, 0.6 * 0.709, 0.6 * 0.709 ** 2]
+        pyramid = ImagePyramid()
+
+        levels_1 = pyramid.build(ivan, scales)
+        levels_2 = pyramid.build(ivan.copy(), scales)
+
+        self.assertEqual([level.shape[0:2] for level in levels_1],
+                         ImagePyramid.level_sizes(ivan.shape[0], ivan.shape[1], scales))
+
+        for level_1, level_2 in zip(levels_1, levels_2):
+            self.assertIs(level_1, level_2)
+            self.assertEqual(level_1.dtype, np.float32)
+
+    def test_float32_preprocessing(self):
+        """
+        The images are normalized straight into float32, matching the float64 normalization, and the detections do not
+        change.
+        :return:
+        """
+        ivan = cv2.imread("ivan.jpg")
+        expected = (ivan.astype(np.float64) - 127.5) * 0.0078125
+
+        for image, out in [(ivan, np.empty(ivan.shape, dtype=np.float32)),
+                           (np.transpose(ivan, (1, 0, 2)), np.empty((700, 600, 3), dtype=np.float32)[50:611, 10:571])]:
+            normalized = normalize(image, out)
+
+            self.assertIs(normalized, out)
+            self.assertEqual(normalized.dtype, np.float32)
+            np.testing.assert_allclose(normalized, expected if image is ivan else np.transpose(expected, (1, 0, 2)),
+                                       atol=1e-6)
+
+        boxes, scores, landmarks = mtcnn.detect_faces(ivan, as_array=True)
+
+        np.testing.assert_allclose(boxes, [[278.717, 90.605, 47.762, 63.866]], atol=1e-2)
+        np.testing.assert_allclose(scores, [0.993], atol=1e-3)
+        np.testing.assert_allclose(landmarks, [[[291.520, 117.344], [314.450, 114.908], [303.682, 131.724],
+                                                [296.715, 143.163], [313.668, 141.589]]], atol=1e-2)
+
+    def test_nms_backends_agree(self):
+        """
+        All the NMS backends pick the same boxes.
+        :return:
+        """
+        random = np.random.RandomState(0)
+        corners = random.rand(500, 2) * 300
+        sizes = random.randint(12, 60, size=(500, 1))
+        boxes = np.hstack([corners, corners + sizes, random.rand(500, 1)])
+
+        for method, threshold in [('Union', 0.5), ('Min', 0.7)]:
+            expected = nms(boxes, threshold, method)
+            self.assertGreater(len(expected), 0)
+
+            for backend in NMS_BACKENDS:
+                np.testing.assert_array_equal(nms(boxes, threshold, method, backend=backend), expected)
+
+        self.assertEqual(nms(np.empty((0, 5)), 0.5).shape, (0,))
+
+    def test_nms_many_boxes(self):
+        """
+        NMS is able to pick more boxes than fit in an int16.
+        :return:
+        """
+        y, x = np.mgrid[0:200, 0:200] * 20.0
+        corners = np.stack([x.ravel(), y.ravel()], axis=1)
+        boxes = np.hstack([corners, corners + 12, np.linspace(0, 1, corners.shape[0])[:, None]])
+
+        pick = nms(boxes, 0.5, 'Union', backend="grid")
+
+        self.assertEqual(len(pick), boxes.shape[0])
+        self.assertEqual(pick[0], boxes.shape[0] - 1)
+
     @classmethod
     def tearDownClass(cls):
         global mtcnn